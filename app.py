@@ -1,14 +1,20 @@
 # app.py
+import io
 import os
+import json
+import time
+import tempfile
 import pandas as pd
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 from flasgger import Swagger, swag_from
 from werkzeug.utils import secure_filename
 
-from utils import get_conn, rows_to_dicts, get_pagination_params, DB_PATH
-from dataframe_utils import get_auxiliary_dataframes, invalidate_dataframe_cache, update_filter_lists, get_unique_categories, get_unique_tribunals
+from database import schema_atualizado, incrementa_geracao, normaliza_nup, nup_valido, COLUNAS_MOVIMENTO
+from utils import get_conn, rows_to_dicts, cursor_to_records, dataframe_to_records, json_response, get_pagination_params, get_cursor_params, keyset_page, iter_export, json_dumps, make_etag, not_modified, with_etag, get_data_generation, DB_PATH
+from process_cache import get_cached, set_cached, invalidate_processos, get_process_cache_stats
+from dataframe_utils import get_auxiliary_dataframes, warm_dataframe_cache, get_current_dataframes, changed_since, update_filter_lists, get_unique_categories, get_unique_tribunals, agrupa_por_periodo, posicoes_filtradas, busca_prefixo, localiza_numeros, recorte, get_memory_report, contagens, DIMENSOES_STATS
 
 app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False
@@ -25,6 +31,57 @@ swagger_template = {
 }
 swagger = Swagger(app, template=swagger_template)
 
+# A migração do schema é um passo explícito (database.py): cada worker só
+# confere a versão, em vez de migrar o banco concorrentemente com os outros
+if os.path.exists(DB_PATH) and not schema_atualizado(DB_PATH):
+    raise RuntimeError(
+        f"Schema do banco {DB_PATH} desatualizado: execute `python database.py --migrar` antes de iniciar a API"
+    )
+
+# Aquecer o cache dos dataframes auxiliares sem bloquear a inicialização
+warm_dataframe_cache(DB_PATH, 'processos.xlsx')
+
+# Colunas do dataframe auxiliar expostas nas listagens -> chave no JSON
+COLUNAS_PROCESSO = {
+    "numeroProcesso": "numeroProcesso",
+    "tribunal": "tribunal",
+    "categoria": "categoria",
+    "sistema_nome": "sistema_nome",
+    "dataHoraUltimaAtualizacao": "dataHoraUltimaAtualizacao",
+    "mov_nome": "ultimoMovimento",
+}
+
+def _inteiro(valor):
+    """
+    Converte um parâmetro inteiro da query string (ausente ou vazio = sem filtro).
+    """
+    if valor is None or valor == "":
+        return None
+    if not valor.isdigit():
+        raise ValueError(f"Valor inteiro inválido: {valor}")
+    return int(valor)
+
+def _componentes_nup():
+    """
+    Filtros pelos componentes do número CNJ (ano, segmento, origem) da query string,
+    no formato {nup_<componente>: int ou None}. ValueError se algum for inválido.
+    """
+    return {
+        f"nup_{nome}": _inteiro(request.args.get(nome))
+        for nome in ("ano", "segmento", "origem")
+    }
+
+# Parâmetros Swagger dos filtros de _componentes_nup
+PARAMETROS_NUP = [
+    {"name": "ano", "in": "query", "type": "integer", "required": False,
+     "description": "Filtro pelo ano de ajuizamento do número CNJ (AAAA)"},
+    {"name": "segmento", "in": "query", "type": "integer", "required": False,
+     "description": "Filtro pelo segmento de justiça do número CNJ (J; ex: 8 = estadual)"},
+    {"name": "origem", "in": "query", "type": "integer", "required": False,
+     "description": "Filtro pela unidade de origem do número CNJ (OOOO)"},
+]
+
+
 @app.route("/processos", methods=["GET"])
 @swag_from({
     "tags": ["processos"],
@@ -35,11 +92,13 @@ swagger = Swagger(app, template=swagger_template)
          "description": "Filtro por tribunal (ex: TJRJ, TJSP, ...)"},
         {"name": "categoria", "in": "query", "type": "string", "required": False,
          "description": "Filtro por categoria"},
+        *PARAMETROS_NUP,
         {"name": "limit", "in": "query", "type": "integer", "required": False, "default": 10000},
         {"name": "offset", "in": "query", "type": "integer", "required": False, "default": 0},
     ],
     "responses": {
-        200: {"description": "Lista de processos com informações auxiliares", "schema": {"type": "object"}}
+        200: {"description": "Lista de processos com informações auxiliares", "schema": {"type": "object"}},
+        400: {"description": "Filtro numérico inválido"}
     }
 })
 def get_processos():
@@ -59,47 +118,272 @@ def get_processos():
         tribunal = request.args.get("tribunal")
         categoria = request.args.get("categoria")
         limit, offset = get_pagination_params(request)
+        try:
+            componentes = _componentes_nup()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Obter dataframe auxiliar
+        # Obter dataframe auxiliar (já ordenado por numeroProcesso)
         dataframes = get_auxiliary_dataframes()
-        df_final = dataframes['final']
 
-        # Aplicar filtros
-        if numero:
-            df_final = df_final[df_final['numeroProcesso'] == numero]
-        if tribunal:
-            df_final = df_final[df_final['tribunal'] == tribunal]
-        if categoria:
-            df_final = df_final[df_final['categoria'] == categoria]
+        # Cliente já tem esta versão: 304 sem filtrar nem serializar
+        etag = make_etag(request, dataframes['geracao'])
+        resposta = not_modified(request, etag)
+        if resposta is not None:
+            return resposta
 
-        # Ordenar por numeroProcesso
-        df_final = df_final.sort_values('numeroProcesso')
+        df_final = dataframes['final']
+
+        # Aplicar filtros pelos índices pré-calculados
+        posicoes = posicoes_filtradas(
+            dataframes, numeroProcesso=numero, tribunal=tribunal, categoria=categoria, **componentes
+        )
 
         # Aplicar paginação
-        total = len(df_final)
-        df_paginated = df_final.iloc[offset:offset + limit]
+        total = len(df_final) if posicoes is None else len(posicoes)
+        df_paginated = recorte(df_final, posicoes, offset, offset + limit)
 
         # Converter para formato JSON
-        data = []
-        for _, row in df_paginated.iterrows():
-            data.append({
-                "numeroProcesso": row['numeroProcesso'],
-                "tribunal": row['tribunal'],
-                "categoria": row['categoria'] if pd.notna(row['categoria']) else None,
-                "sistema_nome": row['sistema_nome'],
-                "dataHoraUltimaAtualizacao": row['dataHoraUltimaAtualizacao'],
-                "ultimoMovimento": row['mov_nome'] if pd.notna(row['mov_nome']) else None
-            })
-
-        return jsonify({
-            "data": data,
+        return with_etag(json_response({
+            "data": dataframe_to_records(df_paginated, COLUNAS_PROCESSO),
             "pagination": {"limit": limit, "offset": offset, "total": total}
+        }), etag)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/processos/changes", methods=["GET"])
+@swag_from({
+    "tags": ["processos"],
+    "parameters": [
+        {"name": "since", "in": "query", "type": "integer", "required": True,
+         "description": "Geração da última sincronização do cliente (campo 'geracao' da resposta anterior)"},
+    ],
+    "responses": {
+        200: {"description": "Processos alterados e removidos desde a geração informada", "schema": {"type": "object"}},
+        400: {"description": "Parâmetro 'since' ausente ou inválido"},
+        410: {"description": "Geração antiga demais (ou houve mudança geral): recarregar tudo via /processos"}
+    }
+})
+def get_processos_changes():
+    """
+    Sincronização incremental da listagem de /processos: retorna, no mesmo
+    formato, apenas os processos inseridos ou alterados desde a geração
+    'since', os números removidos e a nova geração.
+    ---
+    """
+    try:
+        since = int(request.args["since"])
+    except (KeyError, ValueError):
+        return jsonify({"error": "Parâmetro 'since' (inteiro) é obrigatório"}), 400
+
+    try:
+        dataframes = get_current_dataframes(DB_PATH, 'processos.xlsx')
+        geracao = dataframes['geracao']
+
+        numeros = changed_since(DB_PATH, since, geracao)
+        if numeros is None:
+            return jsonify({
+                "error": "Alterações desde esta geração não estão disponíveis; recarregue via /processos",
+                "geracao": geracao,
+                "resync": True
+            }), 410
+
+        # Presentes no cache: alterados; ausentes: removidos
+        numeros = sorted(numeros)
+        posicoes, encontrados = localiza_numeros(dataframes, numeros)
+        removidos = [n for n, encontrado in zip(numeros, encontrados) if not encontrado]
+
+        return json_response({
+            "geracao": geracao,
+            "data": dataframe_to_records(recorte(dataframes['final'], posicoes), COLUNAS_PROCESSO),
+            "removidos": removidos
         })
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/processos/search", methods=["GET"])
+@swag_from({
+    "tags": ["processos"],
+    "parameters": [
+        {"name": "q", "in": "query", "type": "string", "required": True,
+         "description": "Início do número do processo, com ou sem máscara (ex: 0425144-44.2016)"},
+        {"name": "limit", "in": "query", "type": "integer", "required": False, "default": 20,
+         "description": "Máximo de resultados (até 100)"},
+    ],
+    "responses": {
+        200: {"description": "Processos cujo número começa com o prefixo informado", "schema": {"type": "object"}},
+        400: {"description": "Parâmetro 'q' sem dígitos"}
+    }
+})
+def search_processos():
+    """
+    Busca por prefixo do número do processo, no formato de /processos.
+    O número exato vem primeiro; os demais, dos atualizados mais recentemente
+    para os mais antigos.
+    ---
+    """
+    prefixo = normaliza_nup(request.args.get("q", ""))
+    if not prefixo:
+        return jsonify({"error": "Parâmetro 'q' deve conter dígitos do número do processo"}), 400
+    try:
+        limit = max(1, min(int(request.args.get("limit", 20)), 100))
+    except ValueError:
+        limit = 20
+
+    try:
+        dataframes = get_auxiliary_dataframes()
+
+        etag = make_etag(request, dataframes['geracao'])
+        resposta = not_modified(request, etag)
+        if resposta is not None:
+            return resposta
+
+        posicoes, total = busca_prefixo(dataframes, prefixo, limit)
+        return with_etag(json_response({
+            "q": prefixo,
+            "data": dataframe_to_records(recorte(dataframes['final'], posicoes), COLUNAS_PROCESSO),
+            "total": total
+        }), etag)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Colunas da busca textual (ver database.ensure_schema)
+CAMPOS_BUSCA = ("mov_nome", "mov_orgao_nome", "classe_nome", "orgaoJulgador_nome")
+
+def _consulta_fts(texto, campo=None):
+    """
+    Monta a consulta FTS5 a partir do texto digitado: cada palavra vira um
+    termo entre aspas (sem a sintaxe do FTS5) e todos precisam aparecer.
+    """
+    termos = " ".join('"' + termo.replace('"', '""') + '"' for termo in texto.split())
+    return f"{campo} : ({termos})" if campo else termos
+
+def _data_sql(coluna):
+    """
+    Expressão SQL com a data (YYYY-MM-DD) de uma coluna de data em texto, nos
+    formatos aceitos por dataframe_utils.parse_datas (timezone descartado).
+    Valores fora desses formatos resultam em NULL.
+    """
+    valor = f"trim({coluna})"
+    data = (
+        f"CASE WHEN substr({valor}, 3, 1) = '/' "
+        f"THEN substr({valor}, 7, 4) || '-' || substr({valor}, 4, 2) || '-' || substr({valor}, 1, 2) "
+        f"ELSE substr({valor}, 1, 10) END"
+    )
+    return f"(CASE WHEN ({data}) GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' THEN ({data}) END)"
+
+
+@app.route("/search", methods=["GET"])
+@swag_from({
+    "tags": ["processos"],
+    "parameters": [
+        {"name": "q", "in": "query", "type": "string", "required": True,
+         "description": "Texto buscado nos nomes de movimentos, órgãos e classe (ex: sentença)"},
+        {"name": "campo", "in": "query", "type": "string", "required": False,
+         "enum": list(CAMPOS_BUSCA), "description": "Restringe a busca a um dos campos"},
+        {"name": "tribunal", "in": "query", "type": "string", "required": False},
+        {"name": "categoria", "in": "query", "type": "string", "required": False},
+        {"name": "desde", "in": "query", "type": "string", "required": False,
+         "description": "Última atualização a partir desta data (YYYY-MM-DD)"},
+        {"name": "ate", "in": "query", "type": "string", "required": False,
+         "description": "Última atualização até esta data, inclusive (YYYY-MM-DD)"},
+        {"name": "limit", "in": "query", "type": "integer", "required": False, "default": 10000},
+        {"name": "offset", "in": "query", "type": "integer", "required": False, "default": 0},
+    ],
+    "responses": {
+        200: {"description": "Processos encontrados, do mais relevante para o menos", "schema": {"type": "object"}},
+        400: {"description": "Parâmetros inválidos"}
+    }
+})
+def search_texto():
+    """
+    Busca textual (FTS5) por processos cujos movimentos, órgãos ou classe
+    contenham as palavras informadas, combinada com os filtros de /processos
+    e com o período da última atualização. Resposta no formato de /processos.
+    ---
+    """
+    texto = request.args.get("q", "").strip()
+    campo = request.args.get("campo") or None
+    if not texto:
+        return jsonify({"error": "Parâmetro 'q' é obrigatório"}), 400
+    if campo is not None and campo not in CAMPOS_BUSCA:
+        return jsonify({"error": f"Campo inválido: {campo}"}), 400
+    try:
+        desde = pd.Timestamp(request.args["desde"]).strftime("%Y-%m-%d") if request.args.get("desde") else None
+        ate = pd.Timestamp(request.args["ate"]).strftime("%Y-%m-%d") if request.args.get("ate") else None
+    except ValueError:
+        return jsonify({"error": "Datas devem estar no formato YYYY-MM-DD"}), 400
+    limit, offset = get_pagination_params(request)
+
+    try:
+        dataframes = get_auxiliary_dataframes()
+
+        etag = make_etag(request, dataframes['geracao'], get_data_generation())
+        resposta = not_modified(request, etag)
+        if resposta is not None:
+            return resposta
+
+        # Tribunal e período filtrados no SQL, sobre o registro mais recente de
+        # cada processo (como em /processos); a categoria vem do Excel, então
+        # entra como a lista de números da categoria no cache
+        params = {"q": _consulta_fts(texto, campo), "limit": limit, "offset": offset}
+        filtro_numeros = ""
+        categoria = request.args.get("categoria")
+        if categoria:
+            posicoes = posicoes_filtradas(dataframes, categoria=categoria)
+            params["numeros"] = json.dumps(recorte(dataframes['final'], posicoes)['numeroProcesso'].tolist())
+            filtro_numeros = "AND d.numeroProcesso IN (SELECT value FROM json_each(:numeros))"
+        condicoes = []
+        if request.args.get("tribunal"):
+            condicoes.append("tribunal = :tribunal")
+            params["tribunal"] = request.args["tribunal"]
+        if desde is not None:
+            condicoes.append(f"{_data_sql('ultima')} >= :desde")
+            params["desde"] = desde
+        if ate is not None:
+            condicoes.append(f"{_data_sql('ultima')} <= :ate")
+            params["ate"] = ate
+        having = f"HAVING {' AND '.join(condicoes)}" if condicoes else ""
+
+        # Colunas sem agregação vêm da linha do MAX (ver dataframe_utils._query_processos)
+        consulta = f"""
+            SELECT d.numeroProcesso, p.tribunal AS tribunal,
+                   MAX(p.dataHoraUltimaAtualizacao) AS ultima, busca.rank AS relevancia
+            FROM busca
+            JOIN busca_documentos d ON d.id = busca.rowid
+            JOIN processos_dados p ON p.numeroProcesso = d.numeroProcesso
+            WHERE busca MATCH :q {filtro_numeros}
+            GROUP BY d.id
+            {having}
+        """
+        with get_conn() as conn:
+            numeros = [linha[0] for linha in conn.execute(
+                f"{consulta} ORDER BY relevancia, d.numeroProcesso LIMIT :limit OFFSET :offset", params
+            ).fetchall()]
+            # Página incompleta a partir do início: já é o total
+            if offset == 0 and len(numeros) < limit:
+                total = len(numeros)
+            else:
+                total = conn.execute(f"SELECT COUNT(*) FROM ({consulta})", params).fetchone()[0]
+
+        # Linhas do dataframe na ordem de relevância
+        posicoes, _ = localiza_numeros(dataframes, numeros)
+
+        return with_etag(json_response({
+            "data": dataframe_to_records(recorte(dataframes['final'], posicoes), COLUNAS_PROCESSO),
+            "pagination": {"limit": limit, "offset": offset, "total": total}
+        }), etag)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/movimentos/<numero>", methods=["GET"])
 @swag_from({
     "tags": ["movimentos"],
@@ -118,7 +402,21 @@ def get_processos():
             "type": "integer",
             "required": False,
             "default": 0,
-            "description": "Número de linhas a pular (para paginação)"
+            "description": "Número de linhas a pular (legado; prefira cursor)"
+        },
+        {
+            "name": "cursor",
+            "in": "query",
+            "type": "string",
+            "required": False,
+            "description": "Cursor opaco (next_cursor da página anterior)"
+        },
+        {
+            "name": "total",
+            "in": "query",
+            "type": "boolean",
+            "required": False,
+            "description": "Incluir total de linhas (padrão: apenas na primeira página)"
         },
     ],
     "responses": {
@@ -131,30 +429,111 @@ def get_processos():
 def get_movimentos(numero):
     """
     Retorna linhas da tabela **movimentos** de um processo específico.
+    Paginação por cursor: use o next_cursor retornado para obter a próxima página.
     ---
     """
     limit, offset = get_pagination_params(request)
+    try:
+        cursor, incluir_total = get_cursor_params(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    sql = """
-        SELECT *
-        FROM movimentos
-        WHERE numeroProcesso = ?
-        ORDER BY mov_dataHora DESC
-        LIMIT ? OFFSET ?
-    """
-    params = [numero, limit, offset]
+    chave_cache = ("movimentos", limit, offset, request.args.get("cursor"), incluir_total)
+    payload = get_cached(numero, *chave_cache)
+    if payload is not None:
+        return json_response(payload)
 
     with get_conn() as conn:
-        rows = conn.execute(sql, params).fetchall()
-        total = conn.execute(
-            "SELECT COUNT(*) AS total FROM movimentos WHERE numeroProcesso = ?",
-            [numero]
-        ).fetchone()["total"]
-
-    return jsonify({
-        "data": rows_to_dicts(rows),
-        "pagination": {"limit": limit, "offset": offset, "total": total}
-    })
+        rows, next_cursor = keyset_page(
+            conn, "movimentos", ["numeroProcesso = ?"], [numero],
+            "mov_dataHora", limit, cursor, offset, colunas=COLUNAS_MOVIMENTOS
+        )
+        total = None
+        if incluir_total:
+            total = conn.execute(
+                "SELECT COUNT(*) AS total FROM movimentos WHERE numeroProcesso = ?",
+                [numero]
+            ).fetchone()["total"]
+
+    payload = {
+        "data": rows,
+        "pagination": {"limit": limit, "offset": offset, "total": total, "next_cursor": next_cursor}
+    }
+    set_cached(numero, *chave_cache, payload=payload)
+    return json_response(payload)
+
+
+# Feed SSE de movimentos novos: intervalo entre verificações e entre keepalives (segundos)
+SSE_POLL_SECONDS = float(os.getenv("SSE_POLL_SECONDS", 2))
+SSE_KEEPALIVE_SECONDS = 15
+SSE_LOTE = 500
+
+
+@app.route("/events/movimentos", methods=["GET"])
+@swag_from({
+    "tags": ["movimentos"],
+    "parameters": [
+        {"name": "desde", "in": "query", "type": "integer", "required": False,
+         "description": "Último id de evento recebido (alternativa ao header Last-Event-ID)"},
+    ],
+    "responses": {
+        200: {"description": "Stream text/event-stream com um evento 'movimento' por movimento novo"},
+        400: {"description": "Id de evento inválido"}
+    }
+})
+def stream_movimentos_novos():
+    """
+    Feed SSE dos movimentos novos detectados pela ingestão (tabela movimentos_novos).
+    Retoma a partir do Last-Event-ID (reconexão automática do EventSource) ou
+    de ?desde=<id>; sem nenhum dos dois, envia apenas os eventos seguintes.
+    O registro só é consultado quando a geração dos dados muda.
+    ---
+    """
+    ultimo = request.headers.get("Last-Event-ID") or request.args.get("desde")
+    try:
+        ultimo = int(ultimo) if ultimo is not None else None
+    except ValueError:
+        return jsonify({"error": "Id de evento inválido"}), 400
+
+    def generate():
+        nonlocal ultimo
+        conn = get_conn()
+        try:
+            if ultimo is None:
+                ultimo = conn.execute("SELECT COALESCE(MAX(id), 0) FROM movimentos_novos").fetchone()[0]
+            yield "retry: 5000\n\n"
+
+            geracao_vista = None
+            ultimo_envio = time.monotonic()
+            while True:
+                geracao = get_data_generation()
+                if geracao != geracao_vista:
+                    rows = conn.execute("""
+                        SELECT id, geracao, detectadoEm, numeroProcesso, mov_codigo, mov_nome,
+                               mov_dataHora, mov_orgao_codigo, mov_orgao_nome
+                        FROM movimentos_novos WHERE id > ? ORDER BY id LIMIT ?
+                    """, (ultimo, SSE_LOTE)).fetchall()
+                    for row in rows:
+                        ultimo = row["id"]
+                        yield f"id: {ultimo}\nevent: movimento\ndata: {json_dumps(dict(row)).decode()}\n\n"
+                    # Lote cheio: ainda há eventos desta geração a enviar
+                    if len(rows) < SSE_LOTE:
+                        geracao_vista = geracao
+                    if rows:
+                        ultimo_envio = time.monotonic()
+                        continue
+
+                if time.monotonic() - ultimo_envio >= SSE_KEEPALIVE_SECONDS:
+                    yield ": keepalive\n\n"
+                    ultimo_envio = time.monotonic()
+                time.sleep(SSE_POLL_SECONDS)
+        finally:
+            conn.close()
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @app.route("/processos-lista", methods=["GET"])
@@ -165,6 +544,8 @@ def get_movimentos(numero):
          "description": "Filtro por numeroProcesso (exato)"},
         {"name": "limit", "in": "query", "type": "integer", "required": False, "default": 10000},
         {"name": "offset", "in": "query", "type": "integer", "required": False, "default": 0},
+        {"name": "cursor", "in": "query", "type": "string", "required": False,
+         "description": "Cursor opaco (header X-Next-Cursor da página anterior)"},
     ],
     "responses": {
         200: {"description": "Lista mestre de processos", "schema": {"type": "object"}}
@@ -177,41 +558,252 @@ def get_processos_lista():
     """
     numero = request.args.get("numero")
     limit, offset = get_pagination_params(request)
+    try:
+        cursor, _ = get_cursor_params(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     wheres, params = [], []
     if numero:
         wheres.append("numeroProcesso = ?")
         params.append(numero)
 
-    where_sql = f"WHERE {' AND '.join(wheres)}" if wheres else ""
-    sql = f"""
-        SELECT *
-        FROM processos_lista
-        {where_sql}
-        ORDER BY primeiraInclusao DESC
-        LIMIT ? OFFSET ?
+    # Formato esperado pelo frontend; tribunal, grau, classe e ultimaConsulta
+    # não existem em processos_lista e seguem como null
+    colunas = """
+        numeroProcesso AS numero,
+        NULL AS tribunal,
+        NULL AS grau,
+        NULL AS classe,
+        primeiraInclusao,
+        NULL AS ultimaConsulta
     """
-    params_with_pagination = params + [limit, offset]
 
     with get_conn() as conn:
-        rows = conn.execute(sql, params_with_pagination).fetchall()
-        total_sql = f"SELECT COUNT(*) AS total FROM processos_lista {where_sql}"
-        total = conn.execute(total_sql, params).fetchone()["total"] if params else \
-                conn.execute("SELECT COUNT(*) AS total FROM processos_lista").fetchone()["total"]
-
-    # Converter para formato esperado pelo frontend
-    processos = []
-    for row in rows_to_dicts(rows):
-        processos.append({
-            "numero": row.get("numeroProcesso"),
-            "tribunal": row.get("tribunal"),
-            "grau": row.get("grau"),
-            "classe": row.get("classe"),
-            "primeiraInclusao": row.get("primeiraInclusao"),
-            "ultimaConsulta": row.get("ultimaConsulta")
-        })
+        processos, next_cursor = keyset_page(
+            conn, "processos_lista", wheres, params,
+            "primeiraInclusao", limit, cursor, offset, colunas
+        )
+
+    # A resposta é uma lista; o cursor da próxima página vai no header
+    response = json_response(processos)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+@app.route("/export/processos.xlsx", methods=["GET"])
+@swag_from({
+    "tags": ["export"],
+    "parameters": [
+        {"name": "numero", "in": "query", "type": "string", "required": False,
+         "description": "Filtro por numeroProcesso (exato)"},
+        {"name": "tribunal", "in": "query", "type": "string", "required": False,
+         "description": "Filtro por tribunal (ex: TJRJ, TJSP, ...)"},
+        {"name": "categoria", "in": "query", "type": "string", "required": False,
+         "description": "Filtro por categoria"},
+        *PARAMETROS_NUP,
+    ],
+    "responses": {
+        200: {"description": "Planilha com a visão filtrada de /processos"},
+        400: {"description": "Filtro numérico inválido"}
+    }
+})
+def export_processos_xlsx():
+    """
+    Exporta a visão de /processos (com último movimento e categoria) em Excel.
+    Usa workbook write-only do openpyxl: as linhas vão para disco à medida que
+    são escritas, então a memória fica limitada mesmo em exportações grandes.
+    ---
+    """
+    try:
+        componentes = _componentes_nup()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        from openpyxl import Workbook
+
+        dataframes = get_auxiliary_dataframes()
+        df_final = dataframes['final']
+        posicoes = posicoes_filtradas(
+            dataframes,
+            numeroProcesso=request.args.get("numero"),
+            tribunal=request.args.get("tribunal"),
+            categoria=request.args.get("categoria"),
+            **componentes,
+        )
+        total = len(df_final) if posicoes is None else len(posicoes)
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("processos")
+        ws.append(list(COLUNAS_PROCESSO.values()))
+
+        # Escrever em lotes para não materializar o recorte inteiro
+        lote = 5000
+        for inicio in range(0, total, lote):
+            df_lote = recorte(df_final, posicoes, inicio, inicio + lote)
+            valores = [
+                df_lote[coluna].astype(object).where(df_lote[coluna].notna(), None).tolist()
+                for coluna in COLUNAS_PROCESSO
+            ]
+            for linha in zip(*valores):
+                ws.append(linha)
+
+        arquivo = tempfile.TemporaryFile()
+        wb.save(arquivo)
+        arquivo.seek(0)
+
+        return send_file(
+            arquivo,
+            as_attachment=True,
+            download_name='processos_export.xlsx',
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+
+    except Exception as e:
+        return jsonify({"error": f"Erro ao exportar planilha: {str(e)}"}), 500
+
+
+# Tabelas exportáveis em /export e a ordenação usada no streaming
+# Colunas de movimentos nas respostas (a visão movimentos também expõe o rowid)
+COLUNAS_MOVIMENTOS = ", ".join(["numeroProcesso"] + COLUNAS_MOVIMENTO)
+
+TABELAS_EXPORT = {
+    "processos": "numeroProcesso",
+    "movimentos": "numeroProcesso, mov_dataHora",
+}
+# Mimetypes dos formatos (o Flask acrescenta o charset aos tipos text/*)
+FORMATOS_EXPORT = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _filtros_export(tabela, numero, tribunal, categoria, componentes=None):
+    """
+    Monta as condições SQL dos filtros de exportação (mesmos de /processos).
+    A categoria vem do Excel, então é resolvida pelo índice do cache.
+    componentes: filtros do número CNJ ({nup_<componente>: valor}, ver _componentes_nup).
+    """
+    wheres, params = [], []
+    if numero:
+        wheres.append("numeroProcesso = ?")
+        params.append(numero)
+    if tribunal:
+        if tabela == "processos":
+            wheres.append("tribunal = ?")
+        else:
+            wheres.append("numeroProcesso IN (SELECT numeroProcesso FROM processos WHERE tribunal = ?)")
+        params.append(tribunal)
+    nup = {coluna: valor for coluna, valor in (componentes or {}).items() if valor is not None}
+    if nup:
+        condicoes = " AND ".join(f"{coluna} = ?" for coluna in nup)
+        if tabela == "processos":
+            wheres.append(condicoes)
+        else:
+            wheres.append(f"numeroProcesso IN (SELECT numeroProcesso FROM processos WHERE {condicoes})")
+        params.extend(nup.values())
+    if categoria:
+        dataframes = get_auxiliary_dataframes()
+        posicoes = posicoes_filtradas(dataframes, categoria=categoria)
+        numeros = recorte(dataframes['final'], posicoes)['numeroProcesso'].tolist()
+        wheres.append("numeroProcesso IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(numeros))
+    return wheres, params
+
+
+def _coluna_categoria():
+    """
+    Retorna função registro -> categoria (do Excel), por busca binária no cache.
+    As linhas chegam ordenadas por número: a busca só é feita quando ele muda.
+    """
+    dataframes = get_auxiliary_dataframes()
+    categorias = dataframes['final']['categoria'].to_numpy()
+    ultimo = {"numero": None, "categoria": None}
+
+    def categoria(registro):
+        numero = registro["numeroProcesso"]
+        if numero != ultimo["numero"]:
+            posicoes, _ = localiza_numeros(dataframes, [numero])
+            valor = categorias[posicoes[0]] if len(posicoes) else None
+            ultimo["numero"], ultimo["categoria"] = numero, None if pd.isna(valor) else valor
+        return ultimo["categoria"]
+
+    return categoria
+
+
+@app.route("/export/<tabela>", methods=["GET"])
+@swag_from({
+    "tags": ["export"],
+    "parameters": [
+        {"name": "tabela", "in": "path", "type": "string", "required": True,
+         "enum": ["processos", "movimentos"]},
+        {"name": "formato", "in": "query", "type": "string", "required": False,
+         "enum": ["ndjson", "csv"], "default": "ndjson"},
+        {"name": "numero", "in": "query", "type": "string", "required": False,
+         "description": "Filtro por numeroProcesso (exato)"},
+        {"name": "tribunal", "in": "query", "type": "string", "required": False,
+         "description": "Filtro por tribunal (ex: TJRJ, TJSP, ...)"},
+        {"name": "categoria", "in": "query", "type": "string", "required": False,
+         "description": "Filtro por categoria"},
+        *PARAMETROS_NUP,
+    ],
+    "responses": {
+        200: {"description": "Tabela completa em NDJSON ou CSV (streaming, gzip se aceito pelo cliente)"},
+        400: {"description": "Tabela, formato ou filtro numérico inválido"}
+    }
+})
+def export_tabela(tabela):
+    """
+    Exporta a tabela inteira (com filtros) em streaming, direto do cursor SQLite.
+    A memória do servidor fica constante independente do tamanho da tabela.
+    ---
+    """
+    formato = request.args.get("formato", "ndjson").lower()
+    if tabela not in TABELAS_EXPORT:
+        return jsonify({"error": f"Tabela inválida: {tabela}"}), 400
+    if formato not in FORMATOS_EXPORT:
+        return jsonify({"error": f"Formato inválido: {formato}"}), 400
+
+    try:
+        componentes = _componentes_nup()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        wheres, params = _filtros_export(
+            tabela,
+            request.args.get("numero"),
+            request.args.get("tribunal"),
+            request.args.get("categoria"),
+            componentes,
+        )
+        # Processos saem com a categoria, como em /processos
+        extras = {"categoria": _coluna_categoria()} if tabela == "processos" else None
+    except Exception as e:
+        return jsonify({"error": f"Erro ao preparar exportação: {str(e)}"}), 500
+
+    where_sql = f"WHERE {' AND '.join(wheres)}" if wheres else ""
+    colunas = COLUNAS_MOVIMENTOS if tabela == "movimentos" else "*"
+    sql = f"SELECT {colunas} FROM {tabela} {where_sql} ORDER BY {TABELAS_EXPORT[tabela]}"
+    comprimir = "gzip" in request.headers.get("Accept-Encoding", "").lower()
 
-    return jsonify(processos)
+    def generate():
+        conn = get_conn()
+        conn.row_factory = None
+        try:
+            cursor = conn.execute(sql, params)
+            yield from iter_export(cursor, formato, extras, comprimir=comprimir)
+        finally:
+            conn.close()
+
+    response = Response(generate(), mimetype=FORMATOS_EXPORT[formato])
+    response.headers["Content-Disposition"] = f"attachment; filename={tabela}.{formato}"
+    if comprimir:
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+    return response
 
 
 @app.route("/health", methods=["GET"])
@@ -236,19 +828,20 @@ def get_tribunais():
     ---
     """
     try:
-        # Usar a função atualizada que garante listas únicas
-        tribunais = get_unique_tribunals(DB_PATH)
+        # Listas únicas do índice de filtros do cache (por geração dos dados)
+        dataframes = get_auxiliary_dataframes(DB_PATH, 'processos.xlsx')
+        etag = make_etag(request, dataframes['geracao'])
+        resposta = not_modified(request, etag)
+        if resposta is not None:
+            return resposta
+
+        tribunais = dataframes['filtros']['tribunais']
         
         # Log para debug
         print(f"🔍 Endpoint /tribunais retornando: {tribunais}")
         
-        # Criar resposta com headers para evitar cache
-        response = jsonify(tribunais)
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        
-        return response
+        # O cliente pode guardar a lista, mas revalida (ETag) a cada uso
+        return with_etag(jsonify(tribunais), etag)
     except Exception as e:
         print(f"❌ Erro no endpoint /tribunais: {str(e)}")
         return jsonify({"error": f"Erro ao buscar tribunais: {str(e)}"}), 500
@@ -268,22 +861,20 @@ def get_categorias():
     ---
     """
     try:
-        # Forçar invalidação do cache antes de buscar categorias
-        invalidate_dataframe_cache()
-        
-        # Usar a função atualizada que garante listas únicas
-        categorias = get_unique_categories(DB_PATH, 'processos.xlsx')
+        # Listas únicas do índice de filtros do cache (por geração dos dados)
+        dataframes = get_auxiliary_dataframes(DB_PATH, 'processos.xlsx')
+        etag = make_etag(request, dataframes['geracao'])
+        resposta = not_modified(request, etag)
+        if resposta is not None:
+            return resposta
+
+        categorias = dataframes['filtros']['categorias']
         
         # Log para debug
         print(f"🔍 Endpoint /categorias retornando: {categorias}")
         
-        # Criar resposta com headers para evitar cache
-        response = jsonify(categorias)
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        
-        return response
+        # O cliente pode guardar a lista, mas revalida (ETag) a cada uso
+        return with_etag(jsonify(categorias), etag)
     except Exception as e:
         print(f"❌ Erro no endpoint /categorias: {str(e)}")
         return jsonify({"error": f"Erro ao buscar categorias: {str(e)}"}), 500
@@ -405,6 +996,57 @@ def get_atualizacoes():
         return jsonify({"error": f"Erro interno: {str(e)}"}), 500
 
 
+# Janela (segundos) de validade do ETag de /atualizacoes-dataframe e /stats
+JANELA_ETAG_PERIODOS = 60
+
+
+@app.route("/stats", methods=["GET"])
+@swag_from({
+    "tags": ["atualizacoes"],
+    "parameters": [
+        {"name": "dims", "in": "query", "type": "string", "required": False, "default": "tribunal,categoria",
+         "description": "Dimensões separadas por vírgula: " + ", ".join(DIMENSOES_STATS) + " (vazio = só o total)"},
+    ],
+    "responses": {
+        200: {"description": "Contagens de processos por combinação das dimensões", "schema": {"type": "object"}},
+        400: {"description": "Dimensão inválida"}
+    }
+})
+def get_stats():
+    """
+    Contagens de processos agrupadas pelas dimensões pedidas (tribunal,
+    categoria, classe, município do órgão julgador e período de atualização),
+    para os gráficos da UI em uma única chamada.
+    ---
+    """
+    dims = [d.strip() for d in request.args.get("dims", "tribunal,categoria").split(",") if d.strip()]
+    invalidas = [d for d in dims if d not in DIMENSOES_STATS]
+    if invalidas:
+        return jsonify({"error": f"Dimensões inválidas: {', '.join(invalidas)}"}), 400
+    dims = list(dict.fromkeys(dims))
+
+    try:
+        dataframes = get_auxiliary_dataframes()
+
+        # Os períodos dependem da hora atual: o ETag (e o cubo) valem por uma janela
+        janela = int(time.time() // JANELA_ETAG_PERIODOS)
+        etag = make_etag(request, dataframes['geracao'], janela)
+        resposta = not_modified(request, etag)
+        if resposta is not None:
+            return resposta
+
+        df_contagens = contagens(dataframes, dims, janela)
+        return with_etag(json_response({
+            "geracao": dataframes['geracao'],
+            "dimensoes": dims,
+            "total": int(df_contagens['total'].sum()),
+            "data": dataframe_to_records(df_contagens, {c: c for c in df_contagens.columns})
+        }), etag)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/atualizacoes-dataframe", methods=["GET"])
 @swag_from({
     "tags": ["atualizacoes"],
@@ -431,88 +1073,22 @@ def get_atualizacoes_dataframe():
 
         # Obter dataframe auxiliar
         dataframes = get_auxiliary_dataframes()
-        df_final = dataframes['final']
 
-        # Aplicar filtros
-        if tribunal:
-            df_final = df_final[df_final['tribunal'] == tribunal]
-        if categoria:
-            df_final = df_final[df_final['categoria'] == categoria]
-
-        # Converter para lista de dicionários
-        processos = []
-        for _, row in df_final.iterrows():
-            processos.append({
-                "numeroProcesso": row['numeroProcesso'],
-                "tribunal": row['tribunal'],
-                "categoria": row['categoria'] if pd.notna(row['categoria']) else None,
-                "sistema_nome": row['sistema_nome'],
-                "dataHoraUltimaAtualizacao": row['dataHoraUltimaAtualizacao'],
-                "ultimoMovimento": row['mov_nome'] if pd.notna(row['mov_nome']) else None
-            })
+        # Os períodos dependem da hora atual: o ETag vale por uma janela
+        janela = int(time.time() // JANELA_ETAG_PERIODOS)
+        etag = make_etag(request, dataframes['geracao'], janela)
+        resposta = not_modified(request, etag)
+        if resposta is not None:
+            return resposta
 
-        # Agrupar por período
-        from datetime import datetime, timedelta
-        now = datetime.now()
-        
-        categorias = {
-            "ultimas_24h": [],
-            "ultimos_7_dias": [],
-            "ultimo_mes": [],
-            "ultimo_ano": [],
-            "mais_de_um_ano": []
-        }
-        
-        for processo in processos:
-            data_atualizacao = processo.get("dataHoraUltimaAtualizacao")
-            if not data_atualizacao:
-                categorias["mais_de_um_ano"].append(processo)
-                continue
-                
-            try:
-                # Tentar diferentes formatos de data
-                data = None
-                date_string = str(data_atualizacao)
-                
-                # Tentar formato ISO
-                if 'T' in date_string:
-                    if date_string.endswith('Z'):
-                        date_string = date_string.replace('Z', '+00:00')
-                    data = datetime.fromisoformat(date_string)
-                else:
-                    # Tentar outros formatos comuns
-                    for fmt in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%d/%m/%Y %H:%M:%S']:
-                        try:
-                            data = datetime.strptime(date_string, fmt)
-                            break
-                        except:
-                            continue
-                
-                if data is None:
-                    categorias["mais_de_um_ano"].append(processo)
-                    continue
-                
-                # Remover timezone se existir
-                if data.tzinfo is not None:
-                    data = data.replace(tzinfo=None)
-                
-                diff = now - data
-                
-                if diff <= timedelta(hours=24):
-                    categorias["ultimas_24h"].append(processo)
-                elif diff <= timedelta(days=7):
-                    categorias["ultimos_7_dias"].append(processo)
-                elif diff <= timedelta(days=30):
-                    categorias["ultimo_mes"].append(processo)
-                elif diff <= timedelta(days=365):
-                    categorias["ultimo_ano"].append(processo)
-                else:
-                    categorias["mais_de_um_ano"].append(processo)
-            except Exception as e:
-                # Se houver qualquer erro no parsing da data, colocar na categoria mais antiga
-                categorias["mais_de_um_ano"].append(processo)
+        # Aplicar filtros pelos índices pré-calculados
+        posicoes = posicoes_filtradas(dataframes, tribunal=tribunal, categoria=categoria)
+        df_final = recorte(dataframes['final'], posicoes)
+
+        # Agrupar por período (vetorizado sobre a data já convertida no cache)
+        categorias = agrupa_por_periodo(df_final, COLUNAS_PROCESSO)
         
-        return jsonify(categorias)
+        return with_etag(json_response(categorias), etag)
         
     except Exception as e:
         return jsonify({"error": f"Erro interno: {str(e)}"}), 500
@@ -538,41 +1114,166 @@ def get_processo_agregado(numero):
     - processos_lista (registro mestre).
     ---
     """
-    with get_conn() as conn:
-        proc = conn.execute(
-            "SELECT * FROM processos WHERE numeroProcesso = ? "
-            "ORDER BY dataHoraUltimaAtualizacao DESC LIMIT 1",
-            (numero,)
-        ).fetchone()
-
-        # Buscar as últimas 100 movimentações
-        movs = conn.execute(
-            "SELECT * FROM movimentos WHERE numeroProcesso = ? ORDER BY mov_dataHora DESC LIMIT 100",
-            (numero,)
-        ).fetchall()
-        
-        # Contar total de movimentos
-        mov_count = conn.execute(
-            "SELECT COUNT(*) FROM movimentos WHERE numeroProcesso = ?",
-            (numero,)
-        ).fetchone()[0]
-
-        lista = conn.execute(
-            "SELECT * FROM processos_lista WHERE numeroProcesso = ?",
-            (numero,)
-        ).fetchone()
-
-    if not proc and not lista and mov_count == 0:
+    etag = make_etag(request, get_data_generation())
+    resposta = not_modified(request, etag)
+    if resposta is not None:
+        return resposta
+
+    agregado = _agrega_processos_cache([numero])[numero]
+
+    if agregado is None:
         return jsonify({"error": "Processo não encontrado"}), 404
 
-    return jsonify({
-        "processo": dict(proc) if proc else None,
-        "movimentos": rows_to_dicts(movs),  # Retorna as últimas 100 movimentações
-        "total_movimentos": mov_count,  # Total de movimentos no processo
-        "processos_lista": dict(lista) if lista else None
-    })
+    return with_etag(json_response(agregado), etag)
 
 
+# Máximo de números aceitos por chamada em /processos/batch
+MAX_BATCH = 500
+
+
+def _agrega_processos(conn, numeros, limite_movimentos=100):
+    """
+    Monta o objeto agregado (capa, últimos movimentos, total de movimentos e
+    registro mestre) de vários processos com um número constante de queries.
+
+    Args:
+        conn: Conexão SQLite
+        numeros (list): Números de processo (exatos)
+        limite_movimentos (int): Máximo de movimentos por processo (None = todos)
+
+    Returns:
+        dict: {numero: agregado} — None para processos não encontrados
+    """
+    lista_json = json.dumps(list(numeros))
+    filtro = "numeroProcesso IN (SELECT value FROM json_each(?))"
+
+    # Capa: registro mais recente de cada processo (colunas da linha do MAX)
+    capas = cursor_to_records(conn.execute(f"""
+        SELECT *, MAX(dataHoraUltimaAtualizacao) AS _max
+        FROM processos WHERE {filtro}
+        GROUP BY numeroProcesso
+    """, [lista_json]))
+
+    # Últimos movimentos de cada processo (limitados por processo)
+    movs = cursor_to_records(conn.execute(f"""
+        SELECT * FROM (
+            SELECT {COLUNAS_MOVIMENTOS}, ROW_NUMBER() OVER (
+                PARTITION BY numeroProcesso ORDER BY mov_dataHora DESC
+            ) AS _rn
+            FROM movimentos WHERE {filtro}
+        ) WHERE ? IS NULL OR _rn <= ?
+        ORDER BY numeroProcesso, _rn
+    """, [lista_json, limite_movimentos, limite_movimentos]))
+
+    totais = dict(conn.execute(f"""
+        SELECT numeroProcesso, COUNT(*) FROM movimentos
+        WHERE {filtro} GROUP BY numeroProcesso
+    """, [lista_json]).fetchall())
+
+    listas = cursor_to_records(conn.execute(
+        f"SELECT * FROM processos_lista WHERE {filtro}", [lista_json]
+    ))
+
+    agregados = {
+        numero: {
+            "processo": None,
+            "movimentos": [],
+            "total_movimentos": totais.get(numero, 0),
+            "processos_lista": None
+        }
+        for numero in numeros
+    }
+    for capa in capas:
+        del capa["_max"]
+        agregados[capa["numeroProcesso"]]["processo"] = capa
+    for mov in movs:
+        del mov["_rn"]
+        agregados[mov["numeroProcesso"]]["movimentos"].append(mov)
+    for lista in listas:
+        agregados[lista["numeroProcesso"]]["processos_lista"] = lista
+
+    # Sem capa, sem registro mestre e sem movimentos: não encontrado
+    for numero, agregado in agregados.items():
+        if not agregado["processo"] and not agregado["processos_lista"] and not agregado["total_movimentos"]:
+            agregados[numero] = None
+    return agregados
+
+
+def _agrega_processos_cache(numeros, limite_movimentos=100):
+    """
+    Igual a _agrega_processos, consultando antes o cache por processo;
+    apenas os números ausentes do cache vão ao banco (em uma única rodada).
+    """
+    agregados = {}
+    faltantes = []
+    for numero in numeros:
+        agregado = get_cached(numero, "agregado", limite_movimentos)
+        if agregado is None:
+            faltantes.append(numero)
+        else:
+            agregados[numero] = agregado
+
+    if faltantes:
+        with get_conn() as conn:
+            novos = _agrega_processos(conn, faltantes, limite_movimentos)
+        for numero, agregado in novos.items():
+            if agregado is not None:
+                set_cached(numero, "agregado", limite_movimentos, payload=agregado)
+        agregados.update(novos)
+
+    return {numero: agregados[numero] for numero in numeros}
+
+
+@app.route("/processos/batch", methods=["POST"])
+@swag_from({
+    "tags": ["agregado"],
+    "parameters": [
+        {"name": "body", "in": "body", "required": True, "schema": {
+            "type": "object",
+            "properties": {
+                "numeros": {"type": "array", "items": {"type": "string"},
+                            "description": f"numeroProcesso (exato, sem máscara), até {MAX_BATCH}"},
+                "limite_movimentos": {"type": "integer", "default": 100,
+                                      "description": "Máximo de movimentos por processo (null = todos)"},
+            }
+        }},
+    ],
+    "responses": {
+        200: {"description": "Objetos agregados por número (null se não encontrado)", "schema": {"type": "object"}},
+        400: {"description": "Requisição inválida"}
+    }
+})
+def get_processos_batch():
+    """
+    Retorna vários processos agregados (mesmo formato de /processo/<numero>)
+    em uma única chamada, com queries em conjunto em vez de uma por processo.
+    ---
+    """
+    corpo = request.get_json(silent=True)
+    if not isinstance(corpo, dict):
+        return jsonify({"error": "Envie 'numeros' como lista de strings"}), 400
+    numeros = corpo.get("numeros")
+    limite = corpo.get("limite_movimentos", 100)
+
+    if not isinstance(numeros, list) or not all(isinstance(n, str) for n in numeros):
+        return jsonify({"error": "Envie 'numeros' como lista de strings"}), 400
+    if len(numeros) > MAX_BATCH:
+        return jsonify({"error": f"Máximo de {MAX_BATCH} números por chamada"}), 400
+    if limite is not None and (not isinstance(limite, int) or isinstance(limite, bool) or limite < 0):
+        return jsonify({"error": "'limite_movimentos' deve ser inteiro >= 0 ou null"}), 400
+
+    # Remover duplicatas mantendo a ordem
+    numeros = list(dict.fromkeys(n.strip() for n in numeros))
+
+    try:
+        agregados = _agrega_processos_cache(numeros, limite)
+    except Exception as e:
+        return jsonify({"error": f"Erro ao buscar processos: {str(e)}"}), 500
+
+    return json_response({
+        "data": agregados,
+        "nao_encontrados": [n for n, agregado in agregados.items() if agregado is None]
+    })
 
 
 @app.route("/upload-processos", methods=["POST"])
@@ -608,12 +1309,15 @@ def upload_processos():
         if not file.filename.lower().endswith(('.xlsx', '.xls')):
             return jsonify({"error": "Arquivo deve ser Excel (.xlsx ou .xls)"}), 400
         
-        # Salvar o arquivo temporariamente
+        # Um upload novo descarta o anterior: /confirm-replace só instala
+        # o arquivo temporário se ele passou pela validação abaixo
         temp_filename = 'processos_temp.xlsx'
-        file.save(temp_filename)
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
         
-        # Ler o arquivo para validar e contar registros
-        df = pd.read_excel(temp_filename)
+        # Ler o arquivo (ainda em memória) para validar e contar registros
+        conteudo = file.read()
+        df = pd.read_excel(io.BytesIO(conteudo))
         
         # Verificar se tem dados
         if df.empty:
@@ -623,8 +1327,22 @@ def upload_processos():
         if 'numeroProcesso' not in df.columns:
             return jsonify({"error": "Arquivo deve conter a coluna 'numeroProcesso'"}), 400
         
+        # Números fora do formato CNJ ou com dígito verificador errado são
+        # recusados aqui, antes de qualquer consulta aos tribunais
+        numeros = df['numeroProcesso'].dropna()
+        invalidos = numeros[~numeros.map(normaliza_nup).map(nup_valido)].astype(str).tolist()
+        if invalidos:
+            return jsonify({
+                "error": f"{len(invalidos)} números de processo inválidos (formato CNJ ou dígito verificador)",
+                "invalidos": invalidos
+            }), 400
+        
         total_registros = len(df)
         
+        # Validado: salvar o arquivo temporário para /confirm-replace
+        with open(temp_filename, 'wb') as f:
+            f.write(conteudo)
+        
         return jsonify({
             "message": "Arquivo validado com sucesso",
             "total": total_registros
@@ -687,6 +1405,9 @@ def confirm_replace():
         import shutil
         shutil.move(temp_filename, 'processos.xlsx')
         
+        # As categorias vêm do Excel: nova geração para os caches da API
+        incrementa_geracao(DB_PATH)
+        
         return jsonify({
             "message": "Lista de processos substituída com sucesso"
         })
@@ -695,6 +1416,36 @@ def confirm_replace():
         return jsonify({"error": f"Erro ao confirmar substituição: {str(e)}"}), 500
 
 
+@app.route("/cache/stats", methods=["GET"])
+@swag_from({
+    "tags": ["cache"],
+    "responses": {
+        200: {"description": "Contadores do cache por processo", "schema": {"type": "object"}}
+    }
+})
+def get_cache_stats():
+    """
+    Retorna os contadores (hits, misses, tamanho) do cache por processo.
+    ---
+    """
+    return jsonify(get_process_cache_stats())
+
+
+@app.route("/cache/memoria", methods=["GET"])
+@swag_from({
+    "tags": ["cache"],
+    "responses": {
+        200: {"description": "Uso de memória por coluna dos dataframes em cache", "schema": {"type": "object"}}
+    }
+})
+def get_cache_memoria():
+    """
+    Retorna os bytes ocupados por coluna dos dataframes auxiliares em cache.
+    ---
+    """
+    return jsonify(get_memory_report())
+
+
 @app.route("/update-database", methods=["POST"])
 @swag_from({
     "tags": ["database"],
@@ -736,18 +1487,17 @@ def update_database():
                 "stdout": result.stdout
             }), 500
         
-        # Invalidar cache dos dataframes auxiliares após atualização bem-sucedida
+        # Os caches (dataframes auxiliares e respostas por processo) seguem a
+        # geração dos dados e o registro de alterações gravados pela atualização
+        # (em todos os workers, descartando só os processos alterados)
         try:
-            invalidate_dataframe_cache()
-            print("✅ Cache dos dataframes auxiliares invalidado após atualização do banco")
-            
             # Atualizar listas de filtros (categorias e tribunais)
             print("🔄 Atualizando listas de filtros...")
             filter_lists = update_filter_lists(DB_PATH, 'processos.xlsx')
             print(f"✅ Listas atualizadas: {len(filter_lists['categorias'])} categorias, {len(filter_lists['tribunais'])} tribunais")
             
         except Exception as cache_error:
-            print(f"⚠️ Erro ao invalidar cache: {str(cache_error)}")
+            print(f"⚠️ Erro ao atualizar listas de filtros: {str(cache_error)}")
         
         # Parsear a saída para extrair estatísticas
         output = result.stdout
@@ -906,11 +1656,10 @@ def update_database_stream():
                 return_code = process.wait()
                 yield f"data: {json.dumps({'type': 'log', 'message': f'🏁 Processo finalizado com código: {return_code}', 'level': 'info'})}\n\n"
                 
-                # Invalidar cache dos dataframes auxiliares se a atualização foi bem-sucedida
+                # O cache dos dataframes auxiliares segue a geração dos dados gravada pela atualização
                 if return_code == 0:
                     try:
-                        invalidate_dataframe_cache()
-                        yield f"data: {json.dumps({'type': 'log', 'message': '🔄 Cache dos dataframes auxiliares invalidado', 'level': 'info'})}\n\n"
+                        yield f"data: {json.dumps({'type': 'log', 'message': '🔄 Caches serão atualizados com os processos alterados', 'level': 'info'})}\n\n"
                         
                         # Atualizar listas de filtros (categorias e tribunais)
                         yield f"data: {json.dumps({'type': 'log', 'message': '🔄 Atualizando listas de filtros...', 'level': 'info'})}\n\n"
@@ -922,7 +1671,7 @@ def update_database_stream():
                         yield f"data: {json.dumps({'type': 'log', 'message': message, 'level': 'success'})}\n\n"
                         
                     except Exception as cache_error:
-                        yield f"data: {json.dumps({'type': 'log', 'message': f'⚠️ Erro ao invalidar cache: {str(cache_error)}', 'level': 'warning'})}\n\n"
+                        yield f"data: {json.dumps({'type': 'log', 'message': f'⚠️ Erro ao atualizar listas de filtros: {str(cache_error)}', 'level': 'warning'})}\n\n"
                 
                 # Enviar estatísticas finais
                 yield f"data: {json.dumps({'type': 'log', 'message': '✅ Atualização concluída!', 'level': 'success'})}\n\n"
@@ -1033,6 +1782,7 @@ def clear_database():
     try:
         from database import limpar_banco_dados
         limpar_banco_dados()
+        invalidate_processos()
         
         return jsonify({
             "message": "Banco de dados limpo com sucesso",
@@ -1060,8 +1810,8 @@ def update_filter_lists_endpoint():
     ---
     """
     try:
-        # Invalidar cache primeiro
-        invalidate_dataframe_cache()
+        # Nova geração dos dados: o cache é reconstruído em todos os workers
+        incrementa_geracao(DB_PATH)
         
         # Atualizar listas de filtros
         filter_lists = update_filter_lists(DB_PATH, 'processos.xlsx')
@@ -1115,8 +1865,8 @@ def force_update_filters():
     try:
         print("🔄 Forçando atualização das listas de filtros...")
         
-        # Invalidar cache
-        invalidate_dataframe_cache()
+        # Nova geração dos dados: o cache é reconstruído em todos os workers
+        incrementa_geracao(DB_PATH)
         
         # Obter listas atualizadas
         categorias = get_unique_categories(DB_PATH, 'processos.xlsx')
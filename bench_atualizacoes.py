@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark do agrupamento por período de /atualizacoes-dataframe.
+
+Compara o agrupamento antigo (iterrows + parsing de data por linha) com o
+agrupamento vetorizado de dataframe_utils, sobre um dataframe sintético.
+
+Uso:
+    python bench_atualizacoes.py [linhas]   (padrão: 100000)
+"""
+
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from dataframe_utils import parse_datas, agrupa_por_periodo
+
+COLUNAS = {
+    "numeroProcesso": "numeroProcesso",
+    "tribunal": "tribunal",
+    "categoria": "categoria",
+    "sistema_nome": "sistema_nome",
+    "dataHoraUltimaAtualizacao": "dataHoraUltimaAtualizacao",
+    "mov_nome": "ultimoMovimento",
+}
+
+
+def gera_dataframe(linhas):
+    """
+    Gera um dataframe 'final' sintético com datas espalhadas em dois anos.
+    """
+    random.seed(42)
+    agora = datetime.now()
+    datas = []
+    for _ in range(linhas):
+        data = agora - timedelta(minutes=random.randint(0, 2 * 365 * 24 * 60))
+        datas.append(random.choice([
+            data.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            data.strftime("%Y-%m-%d %H:%M:%S"),
+            None,
+        ]))
+    return pd.DataFrame({
+        "numeroProcesso": [f"{i:020d}" for i in range(linhas)],
+        "tribunal": [random.choice(["TJRS", "TJSP", "TJRJ", "TJPR"]) for _ in range(linhas)],
+        "categoria": [random.choice(["Fumicultores", "Outros Assuntos", None]) for _ in range(linhas)],
+        "sistema_nome": "eproc",
+        "dataHoraUltimaAtualizacao": datas,
+        "mov_nome": [random.choice(["Conclusão", "Juntada", None]) for _ in range(linhas)],
+    })
+
+
+def agrupa_legado(df_final):
+    """
+    Reprodução do agrupamento anterior (loop em Python por linha).
+    """
+    processos = []
+    for _, row in df_final.iterrows():
+        processos.append({
+            "numeroProcesso": row['numeroProcesso'],
+            "tribunal": row['tribunal'],
+            "categoria": row['categoria'] if pd.notna(row['categoria']) else None,
+            "sistema_nome": row['sistema_nome'],
+            "dataHoraUltimaAtualizacao": row['dataHoraUltimaAtualizacao'],
+            "ultimoMovimento": row['mov_nome'] if pd.notna(row['mov_nome']) else None
+        })
+
+    now = datetime.now()
+    categorias = {
+        "ultimas_24h": [],
+        "ultimos_7_dias": [],
+        "ultimo_mes": [],
+        "ultimo_ano": [],
+        "mais_de_um_ano": []
+    }
+    for processo in processos:
+        data_atualizacao = processo.get("dataHoraUltimaAtualizacao")
+        if not data_atualizacao:
+            categorias["mais_de_um_ano"].append(processo)
+            continue
+        date_string = str(data_atualizacao)
+        try:
+            if 'T' in date_string:
+                data = datetime.fromisoformat(date_string.replace('Z', '+00:00'))
+            else:
+                data = datetime.strptime(date_string, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            categorias["mais_de_um_ano"].append(processo)
+            continue
+        data = data.replace(tzinfo=None)
+        diff = now - data
+        if diff <= timedelta(hours=24):
+            categorias["ultimas_24h"].append(processo)
+        elif diff <= timedelta(days=7):
+            categorias["ultimos_7_dias"].append(processo)
+        elif diff <= timedelta(days=30):
+            categorias["ultimo_mes"].append(processo)
+        elif diff <= timedelta(days=365):
+            categorias["ultimo_ano"].append(processo)
+        else:
+            categorias["mais_de_um_ano"].append(processo)
+    return categorias
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"Gerando dataframe sintético com {linhas} linhas...")
+    df = gera_dataframe(linhas)
+
+    inicio = time.perf_counter()
+    legado = agrupa_legado(df)
+    tempo_legado = time.perf_counter() - inicio
+
+    # A conversão de datas acontece uma vez, na criação do cache
+    inicio = time.perf_counter()
+    df['dataHoraUltimaAtualizacao_dt'] = parse_datas(df['dataHoraUltimaAtualizacao'])
+    tempo_parse = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    vetorizado = agrupa_por_periodo(df, COLUNAS)
+    tempo_vetorizado = time.perf_counter() - inicio
+
+    for periodo in legado:
+        if len(legado[periodo]) != len(vetorizado[periodo]):
+            print(f"[AVISO] Divergência em {periodo}: {len(legado[periodo])} x {len(vetorizado[periodo])}")
+
+    print(f"Legado (iterrows):         {tempo_legado:.3f}s")
+    print(f"Conversão de datas (cache): {tempo_parse:.3f}s")
+    print(f"Vetorizado (por request):  {tempo_vetorizado:.3f}s")
+    print(f"Ganho por request:         {tempo_legado / tempo_vetorizado:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import os, re, time, json
+import os, re, time, json, hashlib
 import pandas as pd
 import requests
 from datetime import datetime, timezone
@@ -78,6 +78,38 @@ def normaliza_nup(n):
     # remove tudo que não for dígito
     return re.sub(r"\D", "", s)
 
+# Numeração única do CNJ (Resolução 65/2008): NNNNNNN-DD.AAAA.J.TR.OOOO
+COMPONENTES_NUP = {
+    "nup_sequencial": slice(0, 7),
+    "nup_dv": slice(7, 9),
+    "nup_ano": slice(9, 13),
+    "nup_segmento": slice(13, 14),
+    "nup_tribunal": slice(14, 16),
+    "nup_origem": slice(16, 20),
+}
+
+def decompoe_nup(numero):
+    """
+    Separa um número normalizado (ver normaliza_nup) nos componentes CNJ, como inteiros.
+    Números com 15 a 19 dígitos são completados com zeros à esquerda
+    (o Excel descarta os zeros iniciais do sequencial).
+    Retorna None se o número não tiver o formato CNJ.
+    """
+    numero = str(numero or "")
+    if not re.fullmatch(r"[0-9]{15,20}", numero):
+        return None
+    numero = numero.zfill(20)
+    return {coluna: int(numero[posicoes]) for coluna, posicoes in COMPONENTES_NUP.items()}
+
+def nup_valido(numero):
+    """
+    Confere o dígito verificador (módulo 97, ISO 7064) de um número normalizado.
+    """
+    if decompoe_nup(numero) is None:
+        return False
+    numero = str(numero).zfill(20)
+    return int(numero[:7] + numero[9:] + numero[7:9]) % 97 == 1
+
 def consulta_por_numero_direto(endpoint, numero):
     """
     Consulta um tribunal específico pelo numeroProcesso (modo direto).
@@ -107,7 +139,8 @@ def consulta_por_numero_direto(endpoint, numero):
 def consulta_via_tribunais_api(numero, tribunal=None):
     """
     Consulta um processo via API de tribunais ou modo direto.
-    Retorna o JSON (dict) ou erro em dict.
+    Retorna o JSON (dict) ou erro em dict; erros com "nao_encontrado" verdadeiro
+    indicam que a consulta funcionou e o processo não existe.
     """
     if MODO_OPERACAO == "direto":
         # Modo direto - consulta direta aos tribunais
@@ -119,14 +152,19 @@ def consulta_via_tribunais_api(numero, tribunal=None):
                 return {"_error": True, "message": f"Tribunal {tribunal} não encontrado"}
         else:
             # Buscar em todos os tribunais
+            falhas = 0
             for trib, endpoint in endpoints.items():
                 resp = consulta_por_numero_direto(endpoint, numero)
                 if resp and not resp.get("_error"):
                     hits = resp.get("hits", {}).get("hits", [])
                     if hits:
                         return resp
+                else:
+                    falhas += 1
                 time.sleep(sleep_between)
-            return {"_error": True, "message": "Processo não encontrado em nenhum tribunal"}
+            # Só é resposta definitiva se todos os tribunais responderam
+            return {"_error": True, "message": "Processo não encontrado em nenhum tribunal",
+                    "nao_encontrado": falhas == 0}
     else:
         # Modo API - usar API separada
         try:
@@ -142,7 +180,9 @@ def consulta_via_tribunais_api(numero, tribunal=None):
                 if result.get("sucesso") and result.get("encontrado"):
                     return result["dados"]
                 else:
-                    return {"_error": True, "message": result.get("erro", "Processo não encontrado")}
+                    # nao_encontrado: a consulta funcionou e o processo não existe
+                    return {"_error": True, "message": result.get("erro", "Processo não encontrado"),
+                            "nao_encontrado": bool(result.get("sucesso"))}
             else:
                 return {"_error": True, "status": response.status_code, "text": response.text}
         except requests.RequestException as e:
@@ -190,51 +230,123 @@ def extrai_registros(hit_json):
                 "mov_orgao_codigo": (m.get("orgaoJulgador") or {}).get("codigoOrgao"),
                 "mov_orgao_nome": (m.get("orgaoJulgador") or {}).get("nomeOrgao"),
             })
-    return pd.DataFrame(procs), pd.DataFrame(movs)
+    df_proc, df_mov = pd.DataFrame(procs), pd.DataFrame(movs)
+
+    # Hash de conteúdo por processo, para grava_sqlite ignorar os que não mudaram
+    if not df_proc.empty:
+        df_proc["hash_conteudo"] = df_proc["numeroProcesso"].map(hash_conteudo(df_proc, df_mov))
+    return df_proc, df_mov
+
+# Versão do schema gravada em meta por ensure_schema; incrementar a cada
+# mudança de tabelas/visões/índices que exija migração
+VERSAO_SCHEMA = 1
+
+def schema_atualizado(sqlite_path=db_path):
+    """
+    Verifica, sem alterar o banco, se o schema já está na versão atual.
+    Usada pela API na inicialização: a migração é um passo explícito
+    (ensure_schema, chamado por main ou por `python database.py --migrar`).
+    """
+    eng = create_engine(f"sqlite:///{sqlite_path}")
+    with eng.connect() as con:
+        if not con.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'"
+        )).fetchone():
+            return False
+        versao = con.execute(text("SELECT valor FROM meta WHERE chave = 'versao_schema'")).scalar()
+    return versao is not None and versao >= VERSAO_SCHEMA
 
 def ensure_schema(sqlite_path=db_path):
     """
     Cria as tabelas base e a nova tabela processos_lista (índice mestre).
     A tabela processos_lista impede reprocessamentos: se o número já está lá,
     o script ignora esse processo em execuções futuras.
+    processos e movimentos são visões sobre processos_dados/movimentos_dados
+    com os nomes vindos das tabelas de nomes (bancos antigos são migrados).
     """
     eng = create_engine(f"sqlite:///{sqlite_path}")
     with eng.begin() as con:
-        # Tabela principal de processos
+        # Tabelas de nomes (dicionário): cada par (código, nome) distinto é
+        # gravado uma vez e os fatos guardam só o id inteiro
+        for tabela in TABELAS_NOMES:
+            con.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {tabela} (
+                id INTEGER PRIMARY KEY,
+                codigo INTEGER,
+                nome TEXT
+            )
+            """))
+            con.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{tabela} ON {tabela} (IFNULL(codigo, -1), IFNULL(nome, ''))"
+            ))
+
+        # Capa dos processos (fato); lida pela visão processos
         con.execute(text("""
-        CREATE TABLE IF NOT EXISTS processos (
+        CREATE TABLE IF NOT EXISTS processos_dados (
             id TEXT,
             tribunal TEXT,
             numeroProcesso TEXT,
             grau TEXT,
             dataAjuizamento TEXT,
             nivelSigilo INTEGER,
-            classe_codigo INTEGER,
-            classe_nome TEXT,
+            classe_id INTEGER,
             formato_codigo INTEGER,
             formato_nome TEXT,
-            sistema_codigo INTEGER,
-            sistema_nome TEXT,
-            orgaoJulgador_codigo INTEGER,
-            orgaoJulgador_nome TEXT,
+            sistema_id INTEGER,
+            orgaoJulgador_id INTEGER,
             orgaoJulgador_codigoMunicipioIBGE INTEGER,
             dataHoraUltimaAtualizacao TEXT,
-            timestamp_indice TEXT
+            timestamp_indice TEXT,
+            nup_sequencial INTEGER,
+            nup_dv INTEGER,
+            nup_ano INTEGER,
+            nup_segmento INTEGER,
+            nup_tribunal INTEGER,
+            nup_origem INTEGER
         )
         """))
+        # Componentes do número CNJ (ver decompoe_nup), para filtros por ano/segmento/origem
+        novas = [_adiciona_coluna(con, "processos_dados", coluna, "INTEGER") for coluna in COMPONENTES_NUP]
 
-        # Movimentos (1:N)
+        # Movimentos (1:N); lidos pela visão movimentos
         con.execute(text("""
-        CREATE TABLE IF NOT EXISTS movimentos (
+        CREATE TABLE IF NOT EXISTS movimentos_dados (
             numeroProcesso TEXT,
-            mov_codigo INTEGER,
-            mov_nome TEXT,
+            mov_tipo_id INTEGER,
             mov_dataHora TEXT,
-            mov_orgao_codigo INTEGER,
-            mov_orgao_nome TEXT
+            mov_orgao_id INTEGER
         )
         """))
 
+        # Bancos antigos: processos e movimentos ainda são tabelas com os nomes por extenso
+        migrado = _migra_tabelas_nomes(con)
+        if migrado or any(novas):
+            _preenche_componentes_nup(con)
+
+        # Visões com as colunas originais: consultas e respostas da API não mudam.
+        # movimentos expõe o rowid do fato (paginação por cursor e diff da ingestão)
+        _cria_visao(con, "processos", """
+        SELECT p.id, p.tribunal, p.numeroProcesso, p.grau, p.dataAjuizamento, p.nivelSigilo,
+               c.codigo AS classe_codigo, c.nome AS classe_nome,
+               p.formato_codigo, p.formato_nome,
+               s.codigo AS sistema_codigo, s.nome AS sistema_nome,
+               o.codigo AS orgaoJulgador_codigo, o.nome AS orgaoJulgador_nome,
+               p.orgaoJulgador_codigoMunicipioIBGE, p.dataHoraUltimaAtualizacao, p.timestamp_indice,
+               p.nup_sequencial, p.nup_dv, p.nup_ano, p.nup_segmento, p.nup_tribunal, p.nup_origem
+        FROM processos_dados p
+        LEFT JOIN classes c ON c.id = p.classe_id
+        LEFT JOIN sistemas s ON s.id = p.sistema_id
+        LEFT JOIN orgaos o ON o.id = p.orgaoJulgador_id
+        """)
+        _cria_visao(con, "movimentos", """
+        SELECT m.rowid AS rowid, m.numeroProcesso,
+               t.codigo AS mov_codigo, t.nome AS mov_nome, m.mov_dataHora,
+               o.codigo AS mov_orgao_codigo, o.nome AS mov_orgao_nome
+        FROM movimentos_dados m
+        LEFT JOIN tipos_movimento t ON t.id = m.mov_tipo_id
+        LEFT JOIN orgaos o ON o.id = m.mov_orgao_id
+        """)
+
         # NOVA TABELA: índice mestre de processos
         # - numeroProcesso como PRIMARY KEY evita duplicatas
         # - armazena quando entrou e onde foi encontrado pela primeira vez
@@ -247,9 +359,308 @@ def ensure_schema(sqlite_path=db_path):
         )
         """))
 
+        # Geração dos dados: incrementada por toda transação de escrita,
+        # usada pela API para validar seus caches com uma única consulta
+        con.execute(text("""
+        CREATE TABLE IF NOT EXISTS meta (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER
+        )
+        """))
+        con.execute(text("INSERT OR IGNORE INTO meta (chave, valor) VALUES ('geracao', 0)"))
+
+        # Processos alterados em cada geração (numeroProcesso NULL = mudança geral),
+        # usada pela API para atualizar seus caches só nos processos alterados
+        con.execute(text("""
+        CREATE TABLE IF NOT EXISTS alteracoes (
+            geracao INTEGER,
+            numeroProcesso TEXT
+        )
+        """))
+        con.execute(text("CREATE INDEX IF NOT EXISTS ix_alteracoes_geracao ON alteracoes (geracao)"))
+        # Impressão digital da lista de movimentos de cada processo (ver hash_movimentos)
+        con.execute(text("""
+        CREATE TABLE IF NOT EXISTS hashes_processos (
+            numeroProcesso TEXT PRIMARY KEY,
+            hash_movimentos TEXT,
+            hash_conteudo TEXT
+        )
+        """))
+        _adiciona_coluna(con, "hashes_processos", "hash_conteudo", "TEXT")
+
+        # Movimentos novos detectados na ingestão (só acrescenta; lido por /events/movimentos)
+        con.execute(text("""
+        CREATE TABLE IF NOT EXISTS movimentos_novos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            geracao INTEGER,
+            detectadoEm TEXT,
+            numeroProcesso TEXT,
+            mov_codigo INTEGER,
+            mov_nome TEXT,
+            mov_dataHora TEXT,
+            mov_orgao_codigo INTEGER,
+            mov_orgao_nome TEXT
+        )
+        """))
+
+        # Busca textual (FTS5): um documento por processo com os nomes de classe,
+        # órgão julgador e movimentos; busca_documentos liga o rowid ao número
+        con.execute(text("""
+        CREATE TABLE IF NOT EXISTS busca_documentos (
+            id INTEGER PRIMARY KEY,
+            numeroProcesso TEXT UNIQUE
+        )
+        """))
+        if not _tem_busca(con):
+            try:
+                # remove_diacritics: 'sentenca' encontra 'Sentença'
+                con.execute(text("""
+                CREATE VIRTUAL TABLE busca USING fts5(
+                    classe_nome, orgaoJulgador_nome, mov_nome, mov_orgao_nome,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+                """))
+                _indexa_busca(con)
+            except Exception as e:
+                print(f"[AVISO] Busca textual indisponível (SQLite sem FTS5?): {e}")
+
+        # Geração a partir da qual o registro de alterações está completo
+        con.execute(text("""
+        INSERT OR IGNORE INTO meta (chave, valor)
+        SELECT 'alteracoes_desde', valor FROM meta WHERE chave = 'geracao'
+        """))
+
         # Índices úteis (opcionais)
-        con.execute(text("CREATE INDEX IF NOT EXISTS ix_proc_numero ON processos (numeroProcesso)"))
-        con.execute(text("CREATE INDEX IF NOT EXISTS ix_mov_numero ON movimentos (numeroProcesso)"))
+        con.execute(text("CREATE INDEX IF NOT EXISTS ix_proc_numero ON processos_dados (numeroProcesso)"))
+        con.execute(text("CREATE INDEX IF NOT EXISTS ix_mov_numero ON movimentos_dados (numeroProcesso)"))
+        # Suportam a paginação por cursor (ordem por data + rowid)
+        con.execute(text("CREATE INDEX IF NOT EXISTS ix_mov_numero_data ON movimentos_dados (numeroProcesso, mov_dataHora)"))
+        con.execute(text("CREATE INDEX IF NOT EXISTS ix_lista_inclusao ON processos_lista (primeiraInclusao)"))
+        # Consultas por componentes do número (ex: TJSP, 2019, origem 0100)
+        con.execute(text("CREATE INDEX IF NOT EXISTS ix_proc_nup_justica ON processos_dados (nup_segmento, nup_tribunal, nup_ano, nup_origem)"))
+        con.execute(text("CREATE INDEX IF NOT EXISTS ix_proc_nup_ano ON processos_dados (nup_ano, nup_origem)"))
+
+        # Chaves naturais: impedem duplicatas quando um processo é gravado de novo
+        _preenche_ids_vazios(con)
+        removidas = _cria_chave_unica(con, "ux_processos_chave", "processos_dados", CHAVE_PROCESSO)
+        removidas += _cria_chave_unica(con, "ux_movimentos_chave", "movimentos_dados", CHAVE_MOVIMENTO)
+        if removidas or migrado:
+            _incrementa_geracao(con)
+        con.execute(text(
+            "INSERT OR REPLACE INTO meta (chave, valor) VALUES ('versao_schema', :v)"
+        ), {"v": VERSAO_SCHEMA})
+
+    if migrado:
+        # Devolve ao sistema as páginas liberadas pelas tabelas antigas
+        with eng.connect() as con:
+            con.exec_driver_sql("VACUUM")
+        print("Migração: nomes de movimentos, classes, sistemas e órgãos movidos para tabelas de nomes")
+
+def _cria_visao(con, nome, select):
+    """
+    Cria a visão, recriando-a se a definição gravada no banco for diferente.
+    """
+    sql = f"CREATE VIEW {nome} AS{select.rstrip()}"
+    atual = con.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'view' AND name = :n"
+    ), {"n": nome}).scalar()
+    if atual != sql:
+        con.execute(text(f"DROP VIEW IF EXISTS {nome}"))
+        con.execute(text(sql))
+
+def _preenche_componentes_nup(con):
+    """
+    Preenche os componentes CNJ (decompoe_nup) das capas gravadas antes das colunas existirem.
+    """
+    numero = "substr('00000' || numeroProcesso, -20)"
+    atribuicoes = ", ".join(
+        f"{coluna} = CAST(substr({numero}, {posicoes.start + 1}, {posicoes.stop - posicoes.start}) AS INTEGER)"
+        for coluna, posicoes in COMPONENTES_NUP.items()
+    )
+    con.execute(text(f"""
+        UPDATE processos_dados SET {atribuicoes}
+        WHERE nup_ano IS NULL AND length(numeroProcesso) BETWEEN 15 AND 20
+          AND numeroProcesso NOT GLOB '*[^0-9]*'
+    """))
+
+def _tem_busca(con):
+    """
+    Indica se a tabela de busca textual (FTS5) existe neste banco.
+    """
+    return con.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'busca'"
+    )).fetchone() is not None
+
+def _indexa_busca(con, numeros=None):
+    """
+    Refaz os documentos de busca textual dos processos informados a partir
+    das capas e movimentos gravados (numeros=None refaz todos).
+    Processos que não estão mais no banco ficam sem documento.
+    """
+    if not _tem_busca(con):
+        return
+    if numeros is None:
+        con.execute(text("DELETE FROM busca"))
+        con.execute(text("DELETE FROM busca_documentos"))
+        con.execute(text(
+            "INSERT INTO busca_documentos (numeroProcesso) SELECT DISTINCT numeroProcesso FROM processos_dados"
+        ))
+        filtro, params = "", {}
+    else:
+        if not numeros:
+            return
+        filtro = "WHERE d.numeroProcesso IN (SELECT value FROM json_each(:numeros))"
+        params = {"numeros": json.dumps(sorted(numeros))}
+        con.execute(text(f"""
+            DELETE FROM busca WHERE rowid IN (SELECT d.id FROM busca_documentos d {filtro})
+        """), params)
+        con.execute(text(f"DELETE FROM busca_documentos AS d {filtro}"), params)
+        con.execute(text("""
+            INSERT INTO busca_documentos (numeroProcesso)
+            SELECT DISTINCT numeroProcesso FROM processos_dados
+            WHERE numeroProcesso IN (SELECT value FROM json_each(:numeros))
+        """), params)
+
+    con.execute(text(f"""
+        INSERT INTO busca (rowid, classe_nome, orgaoJulgador_nome, mov_nome, mov_orgao_nome)
+        SELECT d.id,
+            (SELECT group_concat(DISTINCT classe_nome) FROM processos p WHERE p.numeroProcesso = d.numeroProcesso),
+            (SELECT group_concat(DISTINCT orgaoJulgador_nome) FROM processos p WHERE p.numeroProcesso = d.numeroProcesso),
+            (SELECT group_concat(DISTINCT mov_nome) FROM movimentos m WHERE m.numeroProcesso = d.numeroProcesso),
+            (SELECT group_concat(DISTINCT mov_orgao_nome) FROM movimentos m WHERE m.numeroProcesso = d.numeroProcesso)
+        FROM busca_documentos d {filtro}
+    """), params)
+
+def _migra_tabelas_nomes(con):
+    """
+    Converte as tabelas antigas processos e movimentos (nomes por extenso em
+    cada linha) para processos_dados/movimentos_dados + tabelas de nomes,
+    preservando os rowids. Depois disso processos e movimentos viram visões.
+    
+    Returns:
+        bool: True se havia tabelas antigas para migrar
+    """
+    if not con.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'processos'"
+    )).fetchone():
+        return False
+
+    origens = {"processos": DIMENSOES_PROCESSO, "movimentos": DIMENSOES_MOVIMENTO}
+    for tabela_antiga, dimensoes in origens.items():
+        for tabela, col_codigo, col_nome in dimensoes.values():
+            con.execute(text(f"""
+                INSERT OR IGNORE INTO {tabela} (codigo, nome)
+                SELECT DISTINCT {col_codigo}, {col_nome} FROM {tabela_antiga}
+            """))
+
+    def ids(dimensoes, alias):
+        return ", ".join(
+            f"(SELECT id FROM {tabela} WHERE IFNULL(codigo, -1) = IFNULL({alias}.{col_codigo}, -1)"
+            f" AND IFNULL(nome, '') = IFNULL({alias}.{col_nome}, '')) AS {coluna_id}"
+            for coluna_id, (tabela, col_codigo, col_nome) in dimensoes.items()
+        )
+
+    con.execute(text(f"""
+        INSERT INTO processos_dados (rowid, id, tribunal, numeroProcesso, grau, dataAjuizamento, nivelSigilo,
+            formato_codigo, formato_nome, orgaoJulgador_codigoMunicipioIBGE, dataHoraUltimaAtualizacao,
+            timestamp_indice, {", ".join(DIMENSOES_PROCESSO)})
+        SELECT p.rowid, p.id, p.tribunal, p.numeroProcesso, p.grau, p.dataAjuizamento, p.nivelSigilo,
+            p.formato_codigo, p.formato_nome, p.orgaoJulgador_codigoMunicipioIBGE, p.dataHoraUltimaAtualizacao,
+            p.timestamp_indice, {ids(DIMENSOES_PROCESSO, "p")}
+        FROM processos p
+    """))
+    con.execute(text(f"""
+        INSERT INTO movimentos_dados (rowid, numeroProcesso, mov_dataHora, {", ".join(DIMENSOES_MOVIMENTO)})
+        SELECT m.rowid, m.numeroProcesso, m.mov_dataHora, {ids(DIMENSOES_MOVIMENTO, "m")}
+        FROM movimentos m
+    """))
+    con.execute(text("DROP TABLE processos"))
+    con.execute(text("DROP TABLE movimentos"))
+    return True
+
+def _preenche_ids_vazios(con):
+    """
+    Troca os ids nulos dos fatos (pares código/nome vazios, gravados por
+    versões anteriores) pelo id do par vazio na tabela de nomes.
+    Se a coluna faz parte da chave natural, o índice único é refeito em
+    seguida por _cria_chave_unica, removendo as duplicatas que ficavam
+    escondidas atrás do NULL.
+    """
+    fatos = (
+        ("processos_dados", DIMENSOES_PROCESSO, "ux_processos_chave", CHAVE_PROCESSO),
+        ("movimentos_dados", DIMENSOES_MOVIMENTO, "ux_movimentos_chave", CHAVE_MOVIMENTO),
+    )
+    for tabela_fato, dimensoes, indice, chave in fatos:
+        nulos = " OR ".join(f"{coluna_id} IS NULL" for coluna_id in dimensoes)
+        if not con.execute(text(f"SELECT 1 FROM {tabela_fato} WHERE {nulos} LIMIT 1")).fetchone():
+            continue
+        if any(coluna_id in chave for coluna_id in dimensoes):
+            con.execute(text(f"DROP INDEX IF EXISTS {indice}"))
+        for coluna_id, (tabela, _, _) in dimensoes.items():
+            vazio = _ids_nomes(con, tabela, [(None, None)])[(None, None)]
+            con.execute(text(
+                f"UPDATE {tabela_fato} SET {coluna_id} = :v WHERE {coluna_id} IS NULL"
+            ), {"v": vazio})
+
+def _cria_chave_unica(con, indice, tabela, colunas):
+    """
+    Cria o índice único da chave natural da tabela (migração de bancos antigos),
+    removendo antes as duplicatas (mantém a linha gravada por último).
+    Linhas com alguma coluna da chave nula não são afetadas.
+    
+    Returns:
+        int: Linhas duplicadas removidas
+    """
+    if con.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :n"
+    ), {"n": indice}).fetchone():
+        return 0
+    nao_nulas = " AND ".join(f"{c} IS NOT NULL" for c in colunas)
+    removidas = con.execute(text(f"""
+        DELETE FROM {tabela}
+        WHERE {nao_nulas} AND rowid NOT IN (
+            SELECT MAX(rowid) FROM {tabela} WHERE {nao_nulas} GROUP BY {", ".join(colunas)}
+        )
+    """)).rowcount
+    con.execute(text(f"CREATE UNIQUE INDEX {indice} ON {tabela} ({', '.join(colunas)})"))
+    if removidas:
+        print(f"Migração: {removidas} linhas duplicadas removidas de {tabela}")
+    return removidas
+
+def _adiciona_coluna(con, tabela, coluna, tipo):
+    """
+    Adiciona a coluna à tabela se ainda não existir (migração de bancos antigos).
+    """
+    colunas = {linha[1] for linha in con.execute(text(f"PRAGMA table_info({tabela})")).fetchall()}
+    if coluna not in colunas:
+        con.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}"))
+        return True
+    return False
+
+def _incrementa_geracao(con, numeros=None):
+    """
+    Incrementa a geração dos dados dentro da transação de escrita em curso
+    e registra em alteracoes os processos alterados nela.
+    numeros=None registra uma mudança geral (ex: limpeza do banco).
+    """
+    con.execute(text("UPDATE meta SET valor = valor + 1 WHERE chave = 'geracao'"))
+    geracao = con.execute(text("SELECT valor FROM meta WHERE chave = 'geracao'")).scalar()
+    if numeros is None:
+        registros = [{"g": geracao, "n": None}]
+    else:
+        registros = [{"g": geracao, "n": n} for n in numeros]
+    if registros:
+        con.execute(text("INSERT INTO alteracoes (geracao, numeroProcesso) VALUES (:g, :n)"), registros)
+    return geracao
+
+def incrementa_geracao(sqlite_path=db_path):
+    """
+    Incrementa a geração dos dados em uma transação própria.
+    Usada quando algo fora do banco muda os dados servidos (ex: o Excel de categorias).
+    """
+    eng = create_engine(f"sqlite:///{sqlite_path}")
+    with eng.begin() as con:
+        _incrementa_geracao(con)
 
 def carrega_lista_existente(sqlite_path=db_path):
     """
@@ -265,24 +676,381 @@ def carrega_lista_existente(sqlite_path=db_path):
 def insere_na_processos_lista(numero, tribunal, sqlite_path=db_path):
     """
     Insere o número na tabela processos_lista (se ainda não existir).
-    Como a PRIMARY KEY é numeroProcesso, repetição será ignorada usando UPSERT.
+    Se já existir, só atualiza ultimoUpdate, sem registrar alteração
+    (a data da consulta não muda os dados servidos pela API).
+    
+    Returns:
+        bool: True se o número foi inserido agora
     """
     eng = create_engine(f"sqlite:///{sqlite_path}")
     agora = datetime.now(timezone.utc).isoformat(timespec="seconds").replace('+00:00', 'Z')
     with eng.begin() as con:
-        con.execute(text("""
-            INSERT INTO processos_lista (numeroProcesso, tribunal_inicial, primeiraInclusao, ultimoUpdate)
+        inserido = con.execute(text("""
+            INSERT OR IGNORE INTO processos_lista (numeroProcesso, tribunal_inicial, primeiraInclusao, ultimoUpdate)
             VALUES (:n, :t, :agora, :agora)
-            ON CONFLICT(numeroProcesso) DO UPDATE SET ultimoUpdate = excluded.ultimoUpdate
-        """), {"n": numero, "t": tribunal, "agora": agora})
+        """), {"n": numero, "t": tribunal, "agora": agora}).rowcount == 1
+        if inserido:
+            _incrementa_geracao(con, [numero])
+        else:
+            con.execute(text(
+                "UPDATE processos_lista SET ultimoUpdate = :agora WHERE numeroProcesso = :n"
+            ), {"n": numero, "agora": agora})
+    return inserido
+
+# Chaves naturais (índices únicos criados em ensure_schema)
+CHAVE_PROCESSO = ["id", "grau"]
+CHAVE_MOVIMENTO = ["numeroProcesso", "mov_tipo_id", "mov_dataHora", "mov_orgao_id"]
+
+# Colunas de id nos fatos -> (tabela de nomes, coluna do código, coluna do nome)
+DIMENSOES_PROCESSO = {
+    "classe_id": ("classes", "classe_codigo", "classe_nome"),
+    "sistema_id": ("sistemas", "sistema_codigo", "sistema_nome"),
+    "orgaoJulgador_id": ("orgaos", "orgaoJulgador_codigo", "orgaoJulgador_nome"),
+}
+DIMENSOES_MOVIMENTO = {
+    "mov_tipo_id": ("tipos_movimento", "mov_codigo", "mov_nome"),
+    "mov_orgao_id": ("orgaos", "mov_orgao_codigo", "mov_orgao_nome"),
+}
+TABELAS_NOMES = ("classes", "sistemas", "orgaos", "tipos_movimento")
+
+# Campos que identificam um movimento (ver hash_movimentos)
+COLUNAS_MOVIMENTO = ["mov_codigo", "mov_nome", "mov_dataHora", "mov_orgao_codigo", "mov_orgao_nome"]
+
+# Campos da capa fora do hash de conteúdo: o @timestamp muda a cada
+# reindexação do DataJud mesmo sem mudança no processo
+COLUNAS_FORA_DO_HASH = {"numeroProcesso", "timestamp_indice", "hash_conteudo"}
+
+def _valor_canonico(v):
+    """
+    Normaliza um valor para comparação: NaN vira None e floats inteiros
+    (colunas com ausentes viram float no pandas) voltam a int.
+    """
+    if v is None or (isinstance(v, float) and v != v):
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+def _movimentos_por_processo(linhas):
+    """
+    Agrupa linhas (numeroProcesso, *COLUNAS_MOVIMENTO) em {numero: [tupla canônica]}.
+    """
+    grupos = {}
+    for linha in linhas:
+        grupos.setdefault(linha[0], []).append(tuple(_valor_canonico(v) for v in linha[1:]))
+    return grupos
+
+def _linhas_movimentos(dfm, numeros=None):
+    """
+    Linhas (numeroProcesso, *COLUNAS_MOVIMENTO) do dataframe de movimentos,
+    opcionalmente só dos números informados.
+    """
+    if dfm.empty:
+        return []
+    if numeros is not None:
+        dfm = dfm[dfm["numeroProcesso"].isin(numeros)]
+    return dfm[["numeroProcesso"] + COLUNAS_MOVIMENTO].itertuples(index=False)
+
+def _sha1(valores):
+    """
+    sha1 de uma lista de tuplas canônicas, independente da ordem.
+    """
+    return hashlib.sha1(json.dumps(sorted(valores, key=repr), default=str).encode()).hexdigest()
+
+def hash_movimentos(dfm, numeros):
+    """
+    Impressão digital (sha1) da lista de movimentos de cada processo,
+    independente da ordem em que a API devolveu os movimentos.
+    Processos sem movimentos também recebem um hash (da lista vazia).
+    """
+    grupos = _movimentos_por_processo(_linhas_movimentos(dfm))
+    return {numero: _sha1(grupos.get(numero, [])) for numero in numeros}
+
+def hash_conteudo(dfp, dfm):
+    """
+    Hash de conteúdo de cada processo: campos da capa (de todos os graus) e
+    lista de movimentos. Processos com o mesmo hash não precisam ser regravados.
+    
+    Returns:
+        dict: {numeroProcesso: sha1}
+    """
+    if dfp.empty:
+        return {}
+    colunas = sorted(c for c in dfp.columns if c not in COLUNAS_FORA_DO_HASH)
+    capas = {}
+    for linha in dfp[["numeroProcesso"] + colunas].itertuples(index=False):
+        capas.setdefault(linha[0], []).append(tuple(_valor_canonico(v) for v in linha[1:]))
+    movimentos = hash_movimentos(dfm, capas)
+    return {
+        numero: _sha1([(tuple(colunas),) + tuple(linhas), (movimentos[numero],)])
+        for numero, linhas in capas.items()
+    }
+
+def _ids_nomes(con, tabela, pares):
+    """
+    Ids dos pares (código, nome) na tabela de nomes, cadastrando os que faltam.
+    O par vazio (None, None) também vira uma linha, para que nenhum id fique
+    nulo nos fatos (o UNIQUE do SQLite trata NULLs como distintos).
+    
+    Returns:
+        dict: {(codigo, nome): id}
+    """
+    pares = json.dumps([list(p) for p in set(pares)])
+    con.execute(text(f"""
+        INSERT OR IGNORE INTO {tabela} (codigo, nome)
+        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(:pares)
+    """), {"pares": pares})
+    return {
+        (codigo, nome): id_
+        for id_, codigo, nome in con.execute(text(f"""
+            SELECT t.id, t.codigo, t.nome FROM json_each(:pares) AS j
+            JOIN {tabela} t
+              ON IFNULL(t.codigo, -1) = IFNULL(json_extract(j.value, '$[0]'), -1)
+             AND IFNULL(t.nome, '') = IFNULL(json_extract(j.value, '$[1]'), '')
+        """), {"pares": pares}).fetchall()
+    }
+
+def _codifica_nomes(con, registros, dimensoes):
+    """
+    Troca, nos registros, cada par código/nome pelo id da tabela de nomes
+    (formato das tabelas *_dados). Altera os registros recebidos.
+    """
+    for coluna_id, (tabela, col_codigo, col_nome) in dimensoes.items():
+        pares = [(r.pop(col_codigo, None), r.pop(col_nome, None)) for r in registros]
+        ids = _ids_nomes(con, tabela, pares)
+        for registro, par in zip(registros, pares):
+            registro[coluna_id] = ids.get(par)
+    return registros
+
+def _aplica_movimentos(con, dfm, numeros):
+    """
+    Leva os movimentos gravados dos processos informados ao estado de dfm
+    apagando e inserindo apenas os movimentos que mudaram.
+    
+    Returns:
+        list: Registros {numeroProcesso, mov_*} inseridos
+    """
+    if not numeros:
+        return []
+    lista = json.dumps(sorted(numeros))
+    # {numero: {tupla: [rowids]}}
+    gravados = {}
+    for linha in con.execute(text(f"""
+        SELECT rowid, numeroProcesso, {", ".join(COLUNAS_MOVIMENTO)} FROM movimentos
+        WHERE numeroProcesso IN (SELECT value FROM json_each(:numeros))
+    """), {"numeros": lista}).fetchall():
+        movimento = tuple(_valor_canonico(v) for v in linha[2:])
+        gravados.setdefault(linha[1], {}).setdefault(movimento, []).append(linha[0])
+    recebidos = _movimentos_por_processo(_linhas_movimentos(dfm, numeros))
+
+    inserir, apagar = [], []
+    for numero in numeros:
+        existentes = gravados.get(numero, {})
+        for movimento in recebidos.get(numero, []):
+            rowids = existentes.get(movimento)
+            if rowids:
+                rowids.pop()
+            else:
+                inserir.append({"numeroProcesso": numero, **dict(zip(COLUNAS_MOVIMENTO, movimento))})
+        for rowids in existentes.values():
+            apagar.extend(rowids)
+
+    if apagar:
+        con.execute(text(
+            "DELETE FROM movimentos_dados WHERE rowid IN (SELECT value FROM json_each(:ids))"
+        ), {"ids": json.dumps(apagar)})
+    if inserir:
+        # Os nomes fazem parte dos ids: um conflito na chave é o mesmo movimento
+        con.execute(text(f"""
+            INSERT INTO movimentos_dados ({", ".join(CHAVE_MOVIMENTO)})
+            VALUES ({", ".join(":" + c for c in CHAVE_MOVIMENTO)})
+            ON CONFLICT({", ".join(CHAVE_MOVIMENTO)}) DO NOTHING
+        """), _codifica_nomes(con, [dict(m) for m in inserir], DIMENSOES_MOVIMENTO))
+    return inserir
+
+def _grava_capas(con, dfp, numeros):
+    """
+    Grava as capas dos processos informados com upsert pela chave (id, grau)
+    e remove as linhas desses processos que não vieram em dfp.
+    Linhas sem id ou grau não têm chave e são sempre substituídas.
+    """
+    chaves = [] if dfp.empty else [
+        [i, g] for i, g in zip(dfp["id"], dfp["grau"]) if i is not None and g is not None
+    ]
+    con.execute(text("""
+        DELETE FROM processos_dados
+        WHERE numeroProcesso IN (SELECT value FROM json_each(:numeros))
+          AND (id IS NULL OR grau IS NULL OR NOT EXISTS (
+              SELECT 1 FROM json_each(:chaves) AS c
+              WHERE json_extract(c.value, '$[0]') = processos_dados.id
+                AND json_extract(c.value, '$[1]') = processos_dados.grau
+          ))
+    """), {"numeros": json.dumps(sorted(numeros)), "chaves": json.dumps(chaves)})
+    if dfp.empty:
+        return
+
+    registros = _codifica_nomes(con, [
+        {
+            **{c: _valor_canonico(v) for c, v in registro.items()},
+            **(decompoe_nup(registro.get("numeroProcesso")) or dict.fromkeys(COMPONENTES_NUP)),
+        }
+        for registro in dfp.to_dict("records")
+    ], DIMENSOES_PROCESSO)
+    colunas = list(registros[0])
+    atualizar = [c for c in colunas if c not in CHAVE_PROCESSO]
+    con.execute(text(f"""
+        INSERT INTO processos_dados ({", ".join(colunas)})
+        VALUES ({", ".join(":" + c for c in colunas)})
+        ON CONFLICT({", ".join(CHAVE_PROCESSO)}) DO UPDATE SET
+            {", ".join(f"{c} = excluded.{c}" for c in atualizar)}
+    """), registros)
 
 def grava_sqlite(dfp, dfm, sqlite_path=db_path):
+    """
+    Grava capa e movimentos dos processos, na mesma transação.
+    Processos com o hash de conteúdo igual ao gravado são ignorados; nos
+    demais a capa é substituída e os movimentos recebem só as inserções e
+    remoções necessárias. Movimentos que não existiam nos processos já
+    conhecidos são registrados em movimentos_novos.
+    
+    Returns:
+        list: Números efetivamente regravados
+    """
+    numeros = set()
+    for df in (dfp, dfm):
+        if not df.empty:
+            numeros.update(df["numeroProcesso"].dropna().astype(str))
+    if "hash_conteudo" in dfp.columns:
+        hashes = dict(zip(dfp["numeroProcesso"], dfp["hash_conteudo"]))
+        dfp = dfp.drop(columns="hash_conteudo")
+    else:
+        hashes = hash_conteudo(dfp, dfm)
+    hashes_mov = hash_movimentos(dfm, numeros)
+
+    eng = create_engine(f"sqlite:///{sqlite_path}")
+    with eng.begin() as con:
+        anteriores = {
+            linha[0]: (linha[1], linha[2])
+            for linha in con.execute(text("""
+                SELECT numeroProcesso, hash_movimentos, hash_conteudo FROM hashes_processos
+                WHERE numeroProcesso IN (SELECT value FROM json_each(:numeros))
+            """), {"numeros": json.dumps(sorted(numeros))}).fetchall()
+        }
+        alterados = sorted(
+            n for n in numeros
+            if hashes.get(n) is None or anteriores.get(n, (None, None))[1] != hashes[n]
+        )
+        if not alterados:
+            return []
+
+        # Capa: upsert por (id, grau), removendo os graus que não vieram mais
+        _grava_capas(con, dfp[dfp["numeroProcesso"].isin(alterados)] if not dfp.empty else dfp, alterados)
+
+        # Movimentos: só onde a lista mudou, e só as diferenças
+        com_movimentos = [n for n in alterados if anteriores.get(n, (None, None))[0] != hashes_mov[n]]
+        inseridos = _aplica_movimentos(con, dfm, com_movimentos)
+
+        con.execute(text("""
+            INSERT INTO hashes_processos (numeroProcesso, hash_movimentos, hash_conteudo) VALUES (:n, :m, :c)
+            ON CONFLICT(numeroProcesso) DO UPDATE SET
+                hash_movimentos = excluded.hash_movimentos,
+                hash_conteudo = excluded.hash_conteudo
+        """), [{"n": n, "m": hashes_mov[n], "c": hashes.get(n)} for n in alterados])
+        _indexa_busca(con, alterados)
+        geracao = _incrementa_geracao(con, alterados)
+
+        # Eventos apenas para processos já conhecidos (na primeira gravação tudo seria "novo")
+        novos = [m for m in inseridos if m["numeroProcesso"] in anteriores]
+        if novos:
+            agora = datetime.now().isoformat(timespec="seconds")
+            con.execute(text(f"""
+                INSERT INTO movimentos_novos (geracao, detectadoEm, numeroProcesso, {", ".join(COLUNAS_MOVIMENTO)})
+                VALUES (:geracao, :detectadoEm, :numeroProcesso, {", ".join(":" + c for c in COLUNAS_MOVIMENTO)})
+            """), [{"geracao": geracao, "detectadoEm": agora, **novo} for novo in novos])
+    return alterados
+
+def _apaga_processos(con, numeros, tabelas=("processos_dados", "movimentos_dados", "processos_lista", "hashes_processos")):
+    """
+    Remove os registros dos processos informados nas tabelas indicadas.
+    
+    Returns:
+        set: Números que tinham algum registro removido
+    """
+    removidos = set()
+    if not numeros:
+        return removidos
+    lista = json.dumps(sorted(numeros))
+    for tabela in tabelas:
+        removidos.update(linha[0] for linha in con.execute(text(
+            f"DELETE FROM {tabela} WHERE numeroProcesso IN (SELECT value FROM json_each(:numeros)) RETURNING numeroProcesso"
+        ), {"numeros": lista}).fetchall())
+    return removidos
+
+def remove_processos(numeros, sqlite_path=db_path):
+    """
+    Remove completamente os processos informados (capa, movimentos e lista mestre).
+    Números que não estavam no banco não geram alteração.
+    
+    Returns:
+        list: Números efetivamente removidos
+    """
+    numeros = set(numeros)
+    if not numeros:
+        return []
+    eng = create_engine(f"sqlite:///{sqlite_path}")
+    with eng.begin() as con:
+        removidos = sorted(_apaga_processos(con, numeros))
+        if removidos:
+            _indexa_busca(con, removidos)
+            _incrementa_geracao(con, removidos)
+    return removidos
+
+def compacta_alteracoes(sqlite_path=db_path):
+    """
+    Compacta o registro de alterações sem perder informação para as consultas
+    "o que mudou desde a geração X": mantém só a alteração mais recente de cada
+    processo e descarta o que é anterior à última mudança geral (quem está
+    antes dela precisa recarregar tudo de qualquer forma).
+    
+    Returns:
+        int: Linhas removidas
+    """
     eng = create_engine(f"sqlite:///{sqlite_path}")
     with eng.begin() as con:
-        if not dfp.empty:
-            dfp.to_sql("processos", con, if_exists="append", index=False)
-        if not dfm.empty:
-            dfm.to_sql("movimentos", con, if_exists="append", index=False)
+        removidas = 0
+        ultima_geral = con.execute(text(
+            "SELECT MAX(geracao) FROM alteracoes WHERE numeroProcesso IS NULL"
+        )).scalar()
+        if ultima_geral is not None:
+            removidas += con.execute(text(
+                "DELETE FROM alteracoes WHERE geracao < :g"
+            ), {"g": ultima_geral}).rowcount
+        removidas += con.execute(text("""
+            DELETE FROM alteracoes
+            WHERE numeroProcesso IS NOT NULL
+              AND rowid NOT IN (
+                  SELECT MAX(rowid) FROM alteracoes
+                  WHERE numeroProcesso IS NOT NULL
+                  GROUP BY numeroProcesso
+              )
+        """)).rowcount
+    return removidas
+
+def compacta_movimentos_novos(sqlite_path=db_path, manter=None):
+    """
+    Mantém apenas os últimos `manter` eventos de movimentos_novos
+    (padrão: MOVIMENTOS_NOVOS_RETENCAO, 100000).
+    
+    Returns:
+        int: Linhas removidas
+    """
+    manter = manter if manter is not None else int(os.getenv("MOVIMENTOS_NOVOS_RETENCAO", 100000))
+    eng = create_engine(f"sqlite:///{sqlite_path}")
+    with eng.begin() as con:
+        return con.execute(text("""
+            DELETE FROM movimentos_novos
+            WHERE id <= (SELECT MAX(id) FROM movimentos_novos) - :manter
+        """), {"manter": manter}).rowcount
 
 def limpar_banco_dados(sqlite_path=db_path):
     """
@@ -291,9 +1059,12 @@ def limpar_banco_dados(sqlite_path=db_path):
     eng = create_engine(f"sqlite:///{sqlite_path}")
     with eng.begin() as con:
         # Limpar todas as tabelas
-        con.execute(text("DELETE FROM processos"))
-        con.execute(text("DELETE FROM movimentos"))
+        con.execute(text("DELETE FROM processos_dados"))
+        con.execute(text("DELETE FROM movimentos_dados"))
         con.execute(text("DELETE FROM processos_lista"))
+        con.execute(text("DELETE FROM hashes_processos"))
+        _indexa_busca(con)
+        _incrementa_geracao(con)
         print("Banco de dados limpo com sucesso.")
 
 def verificar_tribunais_api():
@@ -338,9 +1109,10 @@ def main():
             count_before = con.execute(text("SELECT COUNT(*) FROM processos")).fetchone()[0]
             print(f"Processos existentes no banco: {count_before}")
         
-        # Limpar o banco de dados completamente
-        limpar_banco_dados(db_path)
-        print("Banco de dados limpo para nova atualização")
+        # Processos já cadastrados: cada um é substituído ao ser reconsultado,
+        # e os que saíram da lista são removidos ao final (em vez de limpar tudo
+        # antes, o que obrigaria a API a recriar seus caches por completo)
+        numeros_anteriores = carrega_lista_existente(db_path)
 
         # Verificar se o arquivo existe
         if not os.path.exists(lista_processos):
@@ -368,16 +1140,18 @@ def main():
         # Normalizar números
         df["numero_limpo"] = df["numeroProcesso"].map(normaliza_nup)
         
-        # Separar números válidos e inválidos
-        df_validos = df[df["numero_limpo"].str.len() >= 15]
-        df_invalidos = df[df["numero_limpo"].str.len() < 15]
+        # Separar números válidos e inválidos (formato CNJ e dígito verificador),
+        # antes de qualquer consulta aos tribunais
+        validos = df["numero_limpo"].map(nup_valido)
+        df_validos = df[validos]
+        df_invalidos = df[~validos]
         
         numeros_excel = df_validos["numero_limpo"].astype(str).unique().tolist()
         numeros_invalidos = df_invalidos["numeroProcesso"].astype(str).unique().tolist()
         
         print(f"Processando {len(numeros_excel)} números únicos válidos do Excel...")
         if numeros_invalidos:
-            print(f"[AVISO] {len(numeros_invalidos)} números inválidos (muito curtos) serão reportados como não encontrados: {numeros_invalidos}")
+            print(f"[AVISO] {len(numeros_invalidos)} números inválidos (formato ou dígito verificador) serão reportados como não encontrados: {numeros_invalidos}")
 
         total_ok = 0
         total_nao_encontrados = 0
@@ -388,6 +1162,9 @@ def main():
         for i, numero in enumerate(numeros_excel, 1):
             print(f"[{i}/{len(numeros_excel)}] Processando {numero}...")
             encontrado = False
+            # Só uma resposta definitiva (sem hits) remove os dados gravados;
+            # falhas de rede ou da API mantêm o que já está no banco
+            sem_resultado = False
             
             # Obter dados do processo
             processo_row = df[df["numero_limpo"] == numero].iloc[0]
@@ -409,8 +1186,10 @@ def main():
                             total_ok += 1
                             encontrado = True
                         else:
+                            sem_resultado = True
                             print(f"[AVISO] {numero} não encontrado em {tribunal_especifico}")
                     else:
+                        sem_resultado = bool(resp and resp.get("nao_encontrado"))
                         print(f"[AVISO] {numero} erro em {tribunal_especifico}: {resp.get('message', 'Erro desconhecido')}")
                 except Exception as e:
                     print(f"[AVISO] {numero} erro em {tribunal_especifico}: {str(e)}")
@@ -418,6 +1197,10 @@ def main():
                 time.sleep(sleep_between)
                 
                 if not encontrado:
+                    if sem_resultado:
+                        remove_processos([numero], db_path)
+                    else:
+                        print(f"[AVISO] {numero} mantido no banco (falha na consulta)")
                     total_tribunais_nao_encontrados += 1
                     
             else:
@@ -440,8 +1223,10 @@ def main():
                             total_ok += 1
                             encontrado = True
                         else:
+                            sem_resultado = True
                             print(f"[AVISO] {numero} não encontrado em nenhum tribunal")
                     else:
+                        sem_resultado = bool(resp and resp.get("nao_encontrado"))
                         print(f"[AVISO] {numero} erro na consulta: {resp.get('message', 'Erro desconhecido')}")
                 except Exception as e:
                     print(f"[AVISO] {numero} erro na consulta: {str(e)}")
@@ -449,9 +1234,27 @@ def main():
                 time.sleep(sleep_between)
 
                 if not encontrado:
+                    if sem_resultado:
+                        remove_processos([numero], db_path)
+                    else:
+                        print(f"[AVISO] {numero} mantido no banco (falha na consulta)")
                     print(f"[ERRO] {numero} não encontrado")
                     total_nao_encontrados += 1
 
+        # Remover processos que não estão mais na lista
+        numeros_removidos = numeros_anteriores - set(numeros_excel)
+        if numeros_removidos:
+            remove_processos(numeros_removidos, db_path)
+            print(f"Processos removidos (fora da lista): {len(numeros_removidos)}")
+
+        # Manter o registro de alterações com uma linha por processo
+        removidas = compacta_alteracoes(db_path)
+        if removidas:
+            print(f"Registro de alterações compactado: {removidas} linhas removidas")
+        removidas = compacta_movimentos_novos(db_path)
+        if removidas:
+            print(f"Eventos antigos de movimentos novos removidos: {removidas}")
+
         # Verificar estado final do banco
         eng = create_engine(f"sqlite:///{db_path}")
         with eng.begin() as con:
@@ -465,7 +1268,7 @@ def main():
         else:
             print(f"Processos não encontrados: {total_nao_encontrados}")
         if total_invalidos > 0:
-            print(f"Processos inválidos (muito curtos): {total_invalidos}")
+            print(f"Processos inválidos (formato ou dígito verificador): {total_invalidos}")
         print(f"Banco: {db_path}")
         print(f"Total de processos no banco: {count_after}")
         print(f"Total de movimentos no banco: {count_movimentos}")
@@ -497,4 +1300,10 @@ def main():
         raise
 
 if __name__ == "__main__":
-    main()
+    import sys
+    if "--migrar" in sys.argv[1:]:
+        # Só atualiza o schema (a API não migra o banco ao iniciar)
+        ensure_schema(db_path)
+        print("Schema do banco atualizado")
+    else:
+        main()
@@ -44,6 +44,8 @@ def create_auxiliary_dataframes(db_path='datajud_processos.db', excel_path='proc
     print(f"Excel carregado: {len(df_excel)} linhas")
     
     # 2. Carregar dados do banco (processos únicos)
+    # Um registro por processo (o grau atualizado por último); no SQLite as
+    # colunas sem agregação vêm da linha do MAX
     query_processos = """
     SELECT 
         numeroProcesso,
@@ -51,7 +53,7 @@ def create_auxiliary_dataframes(db_path='datajud_processos.db', excel_path='proc
         sistema_nome,
         MAX(dataHoraUltimaAtualizacao) as dataHoraUltimaAtualizacao
     FROM processos
-    GROUP BY numeroProcesso, tribunal, sistema_nome
+    GROUP BY numeroProcesso
     """
     
     df_processos = pd.read_sql(query_processos, engine)
@@ -74,26 +76,16 @@ def create_auxiliary_dataframes(db_path='datajud_processos.db', excel_path='proc
     
     # 4. Query para obter o último movimento de cada processo
     query_movimentos = """
-    WITH ultimo_movimento AS (
-        SELECT 
-            numeroProcesso,
-            mov_nome,
-            mov_dataHora,
-            ROW_NUMBER() OVER (
-                PARTITION BY numeroProcesso 
-                ORDER BY mov_dataHora DESC
-            ) as rn
-        FROM movimentos
-        WHERE mov_dataHora IS NOT NULL
-    )
     SELECT 
         numeroProcesso,
-        mov_nome
-    FROM ultimo_movimento
-    WHERE rn = 1
+        mov_nome,
+        MAX(mov_dataHora) as mov_dataHora
+    FROM movimentos
+    WHERE mov_dataHora IS NOT NULL
+    GROUP BY numeroProcesso
     """
     
-    df_movimentos = pd.read_sql(query_movimentos, engine)
+    df_movimentos = pd.read_sql(query_movimentos, engine)[['numeroProcesso', 'mov_nome']]
     print(f"Dataframe de movimentos criado: {len(df_movimentos)} linhas")
     print(f"Colunas: {df_movimentos.columns.tolist()}")
     
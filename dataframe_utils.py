@@ -5,26 +5,79 @@ Este módulo fornece funções para criar dataframes com informações de proces
 e movimentos que serão utilizados nas interfaces do usuário.
 
 Inclui sistema de cache para melhorar performance e invalidação automática
-quando o banco de dados for atualizado.
+quando o banco de dados for atualizado (pela geração dos dados, ver
+utils.get_data_generation).
 """
 
 import pandas as pd
-from sqlalchemy import create_engine
+import numpy as np
+from sqlalchemy import create_engine, text
+from datetime import datetime
 import os
+import json
+import struct
 import time
 import threading
 import re
+from contextlib import contextmanager
+import pyarrow as pa
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from utils import dataframe_to_records, get_data_generation
 
 # Cache global para os dataframes
+# 'data' é um snapshot imutável: cada reconstrução cria um novo dict e o troca
+# atomicamente, enquanto as requisições continuam servindo o anterior
 _dataframe_cache = {
     'data': None,
+    'geracao': None,
     'last_update': 0,
-    'lock': threading.Lock()
+    'lock': threading.Lock(),        # protege os campos acima
+    'build_lock': threading.Lock(),  # garante uma única reconstrução por vez
+    'refreshing': False
 }
 
 # Flag para forçar atualização do cache
 _cache_invalidated = False
 
+# Colunas com poucos valores distintos, armazenadas como categóricas no cache
+COLUNAS_CATEGORICAS = ('tribunal', 'categoria', 'sistema_nome', 'classe_nome', 'mov_nome')
+
+# Colunas inteiras com ausentes -> menor dtype inteiro anulável que as comporta
+COLUNAS_INTEIRAS = {
+    'nup_ano': 'Int16',
+    'nup_segmento': 'Int16',
+    'nup_origem': 'Int16',
+    'orgaoJulgador_codigoMunicipioIBGE': 'Int32',
+}
+
+# Colunas de texto de alta cardinalidade -> strings Arrow (um buffer contíguo
+# por coluna em vez de um objeto Python por linha)
+COLUNAS_TEXTO = ('numeroProcesso', 'dataHoraUltimaAtualizacao', 'numeroProcesso_normalizado')
+_STRING_COMPACTA = pd.StringDtype('pyarrow')
+
+# Versão do formato do snapshot em disco (incrementar ao mudar as colunas do cache)
+SNAPSHOT_VERSAO = 9
+SNAPSHOT_MAGIC = b'DJSNAP\x00\x03'
+
+# Acima desta quantidade de processos alterados, reconstruir o cache inteiro
+# em vez de aplicar a diferença
+DELTA_MAX_PROCESSOS = int(os.getenv("DELTA_MAX_PROCESSOS", 5000))
+
+# Períodos de atualização usados em /atualizacoes-dataframe, do mais recente
+# ao mais antigo, com o limite superior (em dias) de cada um
+PERIODOS_ATUALIZACAO = [
+    ("ultimas_24h", 1),
+    ("ultimos_7_dias", 7),
+    ("ultimo_mes", 30),
+    ("ultimo_ano", 365),
+    ("mais_de_um_ano", None),
+]
+
 def normaliza_nup(n):
     """
     Remove tudo que não for dígito e corrige notação científica vinda do Excel.
@@ -43,6 +96,18 @@ def normaliza_nup(n):
     # remove tudo que não for dígito
     return re.sub(r"\D", "", s)
 
+def normaliza_nups(serie):
+    """
+    Versão vetorizada de normaliza_nup para uma série inteira.
+    """
+    texto = serie.astype(str).str.strip()
+    cientifica = texto.str.fullmatch(r"\d+(\.\d+)?e\+\d+", case=False)
+    if cientifica.any():
+        texto = texto.copy()
+        texto[cientifica] = texto[cientifica].map(normaliza_nup)
+    # remove tudo que não for dígito
+    return texto.str.replace(r"\D", "", regex=True)
+
 def get_auxiliary_dataframes(db_path='datajud_processos.db', excel_path='processos.xlsx', force_refresh=False):
     """
     Cria os dataframes auxiliares para uso nas telas do UI.
@@ -54,54 +119,279 @@ def get_auxiliary_dataframes(db_path='datajud_processos.db', excel_path='process
         force_refresh (bool): Força a atualização do cache
     
     Returns:
-        dict: Dicionário contendo os dataframes:
-            - 'principal': DataFrame com numeroProcesso, tribunal, categoria, sistema_nome, dataHoraUltimaAtualizacao
-            - 'movements': DataFrame com numeroProcesso e mov_nome do último movimento
-            - 'final': DataFrame final com left join entre principal e movements
+        dict: Dicionário contendo:
+            - 'final': DataFrame com um processo por linha (numeroProcesso, tribunal,
+              categoria, sistema_nome, dataHoraUltimaAtualizacao, mov_nome do
+              último movimento, ...), ordenado por numeroProcesso
+            - 'numeros', 'indexes', 'filtros': estruturas de busca sobre o final
+            - 'excel': pares número/categoria do Excel (usados pela atualização incremental)
     """
-    global _dataframe_cache, _cache_invalidated
+    geracao = get_data_generation(db_path)
     
     with _dataframe_cache['lock']:
-        current_time = time.time()
-        
-        # Verificar se precisa atualizar o cache
-        needs_update = (
-            force_refresh or
-            _cache_invalidated or
-            _dataframe_cache['data'] is None or
-            not _is_cache_valid(db_path, excel_path)
-        )
-        
-        if needs_update:
-            print("🔄 Atualizando cache dos dataframes auxiliares...")
-            _dataframe_cache['data'] = _create_dataframes(db_path, excel_path)
-            _dataframe_cache['last_update'] = current_time
+        data = _dataframe_cache['data']
+        desatualizado = _cache_invalidated or _dataframe_cache['geracao'] != geracao
+        idade = time.time() - _dataframe_cache['last_update']
+    
+    # Sem snapshot (primeiro aquecimento) ou atualização forçada: reconstruir e esperar
+    if data is None or force_refresh:
+        return _rebuild_cache(db_path, excel_path, force=force_refresh)
+    
+    # Snapshot desatualizado: servir o anterior e reconstruir em segundo plano
+    if desatualizado:
+        _start_background_refresh(db_path, excel_path)
+        print("📋 Servindo snapshot anterior dos dataframes enquanto o cache é reconstruído")
+    else:
+        print("📋 Usando cache dos dataframes (última atualização: {:.1f}s atrás)".format(idade))
+    
+    return data
+
+def _rebuild_cache(db_path, excel_path, force=False):
+    """
+    Reconstrói o snapshot e o troca atomicamente no cache.
+    Se outro thread, ou outro worker (via snapshot em disco), acabou de
+    reconstruí-lo para a geração atual, reaproveita.
+    """
+    global _cache_invalidated
+    
+    with _dataframe_cache['build_lock']:
+        geracao = get_data_generation(db_path)
+        with _dataframe_cache['lock']:
+            atual = _dataframe_cache['data']
+            geracao_atual = _dataframe_cache['geracao']
+            invalidado = _cache_invalidated
+            if (not force and atual is not None and not invalidado
+                    and geracao_atual == geracao):
+                return atual
+            # Invalidações feitas durante a reconstrução pedirão uma nova
             _cache_invalidated = False
-            print("✅ Cache dos dataframes atualizado!")
-        else:
-            print("📋 Usando cache dos dataframes (última atualização: {:.1f}s atrás)".format(
-                current_time - _dataframe_cache['last_update']
-            ))
         
-        return _dataframe_cache['data']
+        # Um worker por vez reconstrói; os demais esperam e usam o snapshot gravado
+        with _snapshot_lock(db_path):
+            if not force and not invalidado:
+                salvo = _load_snapshot(db_path, excel_path)
+                if salvo is not None and salvo[0] == geracao:
+                    print(f"💾 Snapshot do cache carregado do disco (geração {geracao})")
+                    return _swap_cache(salvo[1], geracao)
+                # Snapshot mais novo que o da memória (ou início a frio): base para a diferença
+                if salvo is not None and (atual is None or salvo[0] > geracao_atual):
+                    geracao_atual, atual = salvo
+            
+            # Só a geração mudou: recarregar apenas os processos alterados desde então
+            numeros = None
+            if not force and not invalidado and atual is not None and geracao_atual is not None:
+                numeros = changed_since(db_path, geracao_atual, geracao)
+                if numeros is not None and len(numeros) > DELTA_MAX_PROCESSOS:
+                    numeros = None
+            
+            if numeros is not None:
+                print(f"🔄 Aplicando {len(numeros)} processo(s) alterado(s) ao cache (geração {geracao})...")
+                data = _apply_delta(atual, numeros, db_path)
+            else:
+                print(f"🔄 Atualizando cache dos dataframes auxiliares (geração {geracao})...")
+                data = _create_dataframes(db_path, excel_path)
+            
+            data['geracao'] = geracao
+            
+            # Servir a cópia mapeada do disco, compartilhada com os outros workers
+            if _save_snapshot(data, geracao, db_path, excel_path):
+                salvo = _load_snapshot(db_path, excel_path)
+                if salvo is not None and salvo[0] == geracao:
+                    data = salvo[1]
+        
+        _swap_cache(data, geracao)
+        print("✅ Cache dos dataframes atualizado!")
+        return data
 
-def _is_cache_valid(db_path, excel_path):
+def _swap_cache(data, geracao):
     """
-    Verifica se o cache ainda é válido comparando timestamps dos arquivos.
+    Publica um novo snapshot no cache do processo.
     """
+    with _dataframe_cache['lock']:
+        _dataframe_cache['data'] = data
+        _dataframe_cache['geracao'] = geracao
+        _dataframe_cache['last_update'] = time.time()
+    return data
+
+def _snapshot_path(db_path):
+    """
+    Caminho do snapshot em disco do cache (vazio em CACHE_SNAPSHOT_PATH desativa).
+    """
+    return os.getenv("CACHE_SNAPSHOT_PATH", f"{db_path}.snapshot")
+
+def _snapshot_origem(db_path, excel_path):
+    """
+    Identifica os arquivos de origem do snapshot: o banco (inode, que muda se o
+    arquivo for recriado) e o Excel (mtime, as categorias vêm dele).
+    """
+    return (SNAPSHOT_VERSAO, os.stat(db_path).st_ino, os.path.getmtime(excel_path))
+
+@contextmanager
+def _snapshot_lock(db_path):
+    """
+    Lock entre processos (flock em <snapshot>.lock) para a reconstrução do cache.
+    Sem snapshot em disco ou sem fcntl (Windows), cada processo reconstrói o seu.
+    """
+    caminho = _snapshot_path(db_path)
+    if not caminho or fcntl is None:
+        yield
+        return
+    with open(f"{caminho}.lock", 'a') as arquivo:
+        fcntl.flock(arquivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+def _save_snapshot(data, geracao, db_path, excel_path):
+    """
+    Grava o snapshot do cache em disco, marcado com a geração dos dados.
+    
+    Formato: SNAPSHOT_MAGIC, posição do cabeçalho, seções Arrow IPC alinhadas
+    (final, excel, numeros e as posições dos índices) e, ao final, o cabeçalho
+    JSON (origem, geração, listas dos filtros, valores dos índices e seções).
+    Nada no arquivo é código: lê-lo não executa nada, mesmo se adulterado.
+    A escrita vai para um arquivo temporário renomeado ao final (atômico;
+    quem já mapeou o anterior continua com ele).
+    
+    Returns:
+        bool: True se o snapshot foi gravado
+    """
+    caminho = _snapshot_path(db_path)
+    if not caminho:
+        return False
     try:
-        if not os.path.exists(db_path) or not os.path.exists(excel_path):
-            return False
+        # Índices: valores no cabeçalho, posições concatenadas em uma seção
+        indices, partes, total = {}, [], 0
+        for coluna, grupos in data['indexes'].items():
+            indices[coluna] = []
+            for valor, posicoes in grupos.items():
+                indices[coluna].append([valor.item() if hasattr(valor, 'item') else valor, total, total + len(posicoes)])
+                partes.append(posicoes)
+                total += len(posicoes)
+        posicoes = np.concatenate(partes).astype(np.int64) if partes else np.empty(0, dtype=np.int64)
         
-        db_mtime = os.path.getmtime(db_path)
-        excel_mtime = os.path.getmtime(excel_path)
+        numeros = data['numeros']
+        largura = numeros.dtype.itemsize
+        secoes = {
+            'final': pa.Table.from_pandas(data['final'], preserve_index=False),
+            'excel': pa.Table.from_pandas(data['excel'], preserve_index=False),
+            'numeros': pa.table({'numeros': pa.FixedSizeBinaryArray.from_buffers(
+                pa.binary(largura), len(numeros), [None, pa.py_buffer(np.ascontiguousarray(numeros))]
+            )}),
+            'posicoes': pa.table({'posicoes': posicoes}),
+        }
         
-        # Cache é válido se os arquivos não foram modificados desde a última atualização
-        return (db_mtime < _dataframe_cache['last_update'] and 
-                excel_mtime < _dataframe_cache['last_update'])
-    except OSError:
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC + bytes(8))
+            tabela = {}
+            for nome, secao in secoes.items():
+                saida = pa.BufferOutputStream()
+                with pa.ipc.new_file(saida, secao.schema) as escritor:
+                    escritor.write_table(secao)
+                bruto = saida.getvalue()
+                f.write(bytes(-f.tell() % 64))
+                tabela[nome] = [f.tell(), bruto.size]
+                f.write(bruto)
+            fim = f.tell()
+            f.write(json.dumps({
+                'origem': list(_snapshot_origem(db_path, excel_path)),
+                'geracao': geracao,
+                'filtros': data['filtros'],
+                'indexes': indices,
+                'secoes': tabela
+            }).encode('utf-8'))
+            f.seek(len(SNAPSHOT_MAGIC))
+            f.write(struct.pack('<Q', fim))
+        os.replace(temporario, caminho)
+        return True
+    except Exception as e:
+        print(f"⚠️ Não foi possível gravar o snapshot do cache: {str(e)}")
         return False
 
+def _load_snapshot(db_path, excel_path):
+    """
+    Mapeia em memória (somente leitura) o snapshot do cache salvo em disco.
+    As strings Arrow, os números e as posições dos índices apontam direto
+    para o arquivo mapeado: as páginas ficam no cache do sistema operacional
+    e são compartilhadas entre os workers.
+    
+    Returns:
+        tuple | None: (geracao, data), ou None se não existir ou for de outra base
+    """
+    caminho = _snapshot_path(db_path)
+    if not caminho or not os.path.exists(caminho):
+        return None
+    try:
+        with pa.memory_map(caminho, 'r') as arquivo:
+            mapa = arquivo.read_buffer()
+        if mapa.slice(0, len(SNAPSHOT_MAGIC)).to_pybytes() != SNAPSHOT_MAGIC:
+            return None
+        fim, = struct.unpack('<Q', mapa.slice(len(SNAPSHOT_MAGIC), 8).to_pybytes())
+        conteudo = json.loads(mapa.slice(fim).to_pybytes())
+        if conteudo['origem'] != list(_snapshot_origem(db_path, excel_path)):
+            return None
+        
+        def secao(nome):
+            inicio, tamanho = conteudo['secoes'][nome]
+            return pa.ipc.open_file(mapa.slice(inicio, tamanho)).read_all().combine_chunks()
+        
+        numeros = secao('numeros').column('numeros').chunk(0)
+        largura = numeros.type.byte_width
+        posicoes = secao('posicoes').column('posicoes').chunk(0).to_numpy()
+        data = {
+            'final': secao('final').to_pandas(),
+            'numeros': np.frombuffer(numeros.buffers()[1], dtype=f'S{largura}', count=len(numeros),
+                                     offset=numeros.offset * largura),
+            'indexes': {
+                coluna: {valor: posicoes[inicio:fim] for valor, inicio, fim in grupos}
+                for coluna, grupos in conteudo['indexes'].items()
+            },
+            'filtros': conteudo['filtros'],
+            'excel': secao('excel').to_pandas(),
+            'geracao': conteudo['geracao']
+        }
+        return conteudo['geracao'], data
+    except Exception as e:
+        print(f"⚠️ Snapshot do cache ignorado: {str(e)}")
+        return None
+
+def _start_background_refresh(db_path, excel_path):
+    """
+    Dispara a reconstrução do cache em um thread de fundo (no máximo um por vez).
+    """
+    with _dataframe_cache['lock']:
+        if _dataframe_cache['refreshing']:
+            return
+        _dataframe_cache['refreshing'] = True
+    
+    def worker():
+        try:
+            _rebuild_cache(db_path, excel_path)
+        except Exception as e:
+            print(f"❌ Erro ao reconstruir cache dos dataframes em segundo plano: {str(e)}")
+        finally:
+            with _dataframe_cache['lock']:
+                _dataframe_cache['refreshing'] = False
+    
+    threading.Thread(target=worker, name="dataframe-cache-refresh", daemon=True).start()
+
+def get_current_dataframes(db_path='datajud_processos.db', excel_path='processos.xlsx'):
+    """
+    Como get_auxiliary_dataframes, mas espera o cache chegar à geração atual
+    dos dados em vez de servir o snapshot anterior durante a reconstrução.
+    """
+    return _rebuild_cache(db_path, excel_path)
+
+def warm_dataframe_cache(db_path='datajud_processos.db', excel_path='processos.xlsx'):
+    """
+    Aquece o cache em segundo plano (chamada na inicialização da API),
+    para que as primeiras requisições não esperem pela criação dos dataframes.
+    """
+    if os.path.exists(db_path) and os.path.exists(excel_path):
+        _start_background_refresh(db_path, excel_path)
+
 def _create_dataframes(db_path, excel_path):
     """
     Função interna para criar os dataframes (sem cache).
@@ -117,46 +407,71 @@ def _create_dataframes(db_path, excel_path):
     engine = create_engine(f'sqlite:///{db_path}')
     
     # 1. Carregar dados do Excel para obter categoria
+    df_excel = _compacta(_load_excel_categories(excel_path))
+    
+    # 2. Processos com categoria e último movimento
+    return _build_snapshot(_build_final(engine, df_excel), df_excel)
+
+def _load_excel_categories(excel_path):
+    """
+    Lê o Excel e retorna os pares numeroProcesso_normalizado, categoria
+    (sem pares repetidos, na ordem do arquivo).
+    """
     df_excel = pd.read_excel(excel_path)
     
     # Normalizar números de processo no Excel para fazer o match com o banco
-    df_excel['numeroProcesso_normalizado'] = df_excel['numeroProcesso'].map(normaliza_nup)
+    df_excel['numeroProcesso_normalizado'] = normaliza_nups(df_excel['numeroProcesso'])
     
-    # CORREÇÃO: Remover duplicatas do Excel baseado no numeroProcesso normalizado
-    # Manter apenas a primeira ocorrência de cada processo único
-    df_excel = df_excel.drop_duplicates(subset=['numeroProcesso_normalizado'], keep='first')
+    df_excel = df_excel[['numeroProcesso_normalizado', 'categoria']]
+    return df_excel.drop_duplicates().reset_index(drop=True)
+
+def _filtro_numeros(numeros):
+    """
+    Condição SQL e parâmetros para restringir uma query a alguns processos.
+    """
+    if numeros is None:
+        return "", {}
+    return ("AND numeroProcesso IN (SELECT value FROM json_each(:numeros))",
+            {"numeros": json.dumps(sorted(numeros))})
+
+def _query_processos(engine, numeros=None):
+    """
+    Carrega um registro por processo (o mais recente), opcionalmente só dos números informados.
+    """
+    filtro, params = _filtro_numeros(numeros)
     
-    # 2. Carregar dados do banco (processos únicos)
-    # CORREÇÃO: Usar apenas numeroProcesso no GROUP BY para evitar duplicatas
-    # Se um processo tem múltiplos registros com diferentes tribunais/sistemas,
-    # manteremos apenas um registro por numeroProcesso (o mais recente)
-    query_processos = """
-    WITH processos_unicos AS (
-        SELECT 
-            numeroProcesso,
-            tribunal,
-            sistema_nome,
-            dataHoraUltimaAtualizacao,
-            ROW_NUMBER() OVER (
-                PARTITION BY numeroProcesso 
-                ORDER BY dataHoraUltimaAtualizacao DESC
-            ) as rn
-        FROM processos
-    )
+    # Um registro por numeroProcesso: com a chave (id, grau) não há mais
+    # duplicatas, só um registro por grau; fica o mais recente. No SQLite, as
+    # colunas sem agregação vêm da linha do MAX (sem window function)
+    query_processos = f"""
     SELECT 
         numeroProcesso,
         tribunal,
         sistema_nome,
-        dataHoraUltimaAtualizacao
-    FROM processos_unicos
-    WHERE rn = 1
+        classe_nome,
+        orgaoJulgador_codigoMunicipioIBGE,
+        nup_ano,
+        nup_segmento,
+        nup_origem,
+        MAX(dataHoraUltimaAtualizacao) AS dataHoraUltimaAtualizacao
+    FROM processos
+    WHERE 1 = 1 {filtro}
+    GROUP BY numeroProcesso
     """
     
-    df_processos = pd.read_sql(query_processos, engine)
+    return pd.read_sql(text(query_processos), engine, params=params)
+
+def _build_principal(df_processos, df_excel):
+    """
+    Junta os processos com a categoria do Excel e converte a data de atualização.
+    """
+    # CORREÇÃO: Remover duplicatas do Excel baseado no numeroProcesso normalizado
+    # Manter apenas a primeira ocorrência de cada processo único
+    df_excel = df_excel.drop_duplicates(subset=['numeroProcesso_normalizado'], keep='first')
     
-    # 3. Merge com Excel para obter categoria (usando número normalizado)
+    # Merge com Excel para obter categoria (usando número normalizado)
     df_principal = df_processos.merge(
-        df_excel[['numeroProcesso_normalizado', 'categoria']], 
+        df_excel, 
         left_on='numeroProcesso', 
         right_on='numeroProcesso_normalizado',
         how='left'
@@ -168,46 +483,386 @@ def _create_dataframes(db_path, excel_path):
     # Limpar categoria (remover espaços extras)
     df_principal['categoria'] = df_principal['categoria'].str.strip()
     
-    # 4. Query para obter o último movimento de cada processo
-    query_movimentos = """
-    WITH ultimo_movimento AS (
-        SELECT 
-            numeroProcesso,
-            mov_nome,
-            mov_dataHora,
-            ROW_NUMBER() OVER (
-                PARTITION BY numeroProcesso 
-                ORDER BY mov_dataHora DESC
-            ) as rn
-        FROM movimentos
-        WHERE mov_dataHora IS NOT NULL
-    )
+    # Data de atualização já convertida, para agrupamentos por período sem parsing por linha
+    df_principal['dataHoraUltimaAtualizacao_dt'] = parse_datas(df_principal['dataHoraUltimaAtualizacao'])
+    
+    return df_principal
+
+def _query_movimentos(engine, numeros=None):
+    """
+    Carrega o último movimento de cada processo, opcionalmente só dos números informados.
+    """
+    filtro, params = _filtro_numeros(numeros)
+    
+    # mov_nome vem da linha do MAX (ver _query_processos); percorre o índice
+    # (numeroProcesso, mov_dataHora) sem ordenar
+    query_movimentos = f"""
     SELECT 
         numeroProcesso,
-        mov_nome
-    FROM ultimo_movimento
-    WHERE rn = 1
+        mov_nome,
+        MAX(mov_dataHora) AS mov_dataHora
+    FROM movimentos
+    WHERE mov_dataHora IS NOT NULL {filtro}
+    GROUP BY numeroProcesso
     """
     
-    df_movements = pd.read_sql(query_movimentos, engine)
+    return pd.read_sql(text(query_movimentos), engine, params=params)[['numeroProcesso', 'mov_nome']]
+
+def _compacta(df):
+    """
+    Reduz a memória de um dataframe do cache: colunas de baixa cardinalidade
+    viram categóricas, inteiros usam o menor dtype anulável e os textos de
+    alta cardinalidade, strings Arrow (buffer contíguo).
+    """
+    df = df.copy()
+    for coluna in COLUNAS_CATEGORICAS:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype('category')
+    for coluna, dtype in COLUNAS_INTEIRAS.items():
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype(dtype)
+    for coluna in COLUNAS_TEXTO:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype(_STRING_COMPACTA)
+    return df
+
+def _build_final(engine, df_excel, numeros=None):
+    """
+    Linhas do dataframe final (processo com categoria e nome do último
+    movimento), opcionalmente só dos números informados, já compactadas.
+    """
+    df_principal = _compacta(_build_principal(_query_processos(engine, numeros), df_excel))
+    df_movements = _compacta(_query_movimentos(engine, numeros))
     
-    # 5. Left join para obter nome do último movimento
-    df_final = df_principal.merge(
+    # Left join para obter nome do último movimento
+    return df_principal.merge(
         df_movements, 
         on='numeroProcesso', 
         how='left'
     )
+
+def _build_snapshot(df_final, df_excel):
+    """
+    Monta o snapshot do cache a partir das linhas do dataframe final.
+    Só o final e o Excel ficam no snapshot: a atualização incremental
+    troca linhas do final em vez de refazer o merge.
+    """
+    # Manter o dataframe final já ordenado por numeroProcesso,
+    # para que as listagens paginem sem ordenar a cada request
+    df_final = df_final.sort_values('numeroProcesso', kind='stable').reset_index(drop=True)
+    
+    return {
+        'final': df_final,
+        'numeros': _chave_numeros(df_final),
+        'indexes': _build_indexes(df_final),
+        'filtros': _build_filter_lists(df_final, df_excel),
+        'excel': df_excel
+    }
+
+def _build_filter_lists(df_final, df_excel):
+    """
+    Listas dos filtros da UI: categorias do Excel dos processos presentes no
+    banco e tribunais do dataframe final (ordenadas, sem duplicatas).
+    """
+    presentes = df_excel['numeroProcesso_normalizado'].isin(df_final['numeroProcesso'])
+    categorias = (df_excel.loc[presentes, 'categoria'].dropna().astype(str)
+                  .str.strip().str.replace('\xa0', ' ', regex=False))
+    tribunais = df_final['tribunal'].dropna().astype(str)
+    return {
+        'categorias': sorted(set(categorias[categorias != ''])),
+        'tribunais': sorted(set(tribunais))
+    }
+
+def _apply_delta(snapshot, numeros, db_path):
+    """
+    Cria um novo snapshot a partir do atual, recarregando do banco apenas os
+    processos informados (o Excel não é relido: a categoria vem do snapshot).
+    """
+    engine = create_engine(f'sqlite:///{db_path}')
+    
+    posicoes, _ = localiza_numeros(snapshot, numeros)
+    df_final = snapshot['final'].drop(index=posicoes)
+    novos = _build_final(engine, snapshot['excel'], numeros)
+    # Categorias diferentes nas duas partes: o concat volta a object, então compactar de novo
+    df_final = _compacta(pd.concat([df_final, novos], ignore_index=True))
+    
+    return _build_snapshot(df_final, snapshot['excel'])
+
+def changed_since(db_path, geracao_de, geracao_ate):
+    """
+    Retorna os números alterados entre duas gerações (tabela alteracoes),
+    ou None se houve mudança geral ou o registro não cobre o intervalo
+    (nesse caso é preciso recarregar tudo).
+    
+    Args:
+        db_path (str): Caminho para o banco SQLite
+        geracao_de (int): Geração já conhecida (exclusiva)
+        geracao_ate (int): Geração de destino (inclusiva)
     
+    Returns:
+        set | None: Números de processo inseridos, alterados ou removidos
+    """
+    if geracao_de > geracao_ate:
+        return None
+    try:
+        engine = create_engine(f'sqlite:///{db_path}')
+        with engine.connect() as con:
+            desde = con.execute(text(
+                "SELECT valor FROM meta WHERE chave = 'alteracoes_desde'"
+            )).scalar()
+            linhas = con.execute(text("""
+                SELECT DISTINCT numeroProcesso FROM alteracoes
+                WHERE geracao > :de AND geracao <= :ate
+            """), {"de": geracao_de, "ate": geracao_ate}).fetchall()
+    except Exception:
+        return None
+    if desde is None or geracao_de < desde:
+        return None
+    numeros = {linha[0] for linha in linhas}
+    if None in numeros:
+        return None
+    return numeros
+
+# Colunas do dataframe final com índice de posições pré-calculado
+# (numeroProcesso é resolvido por busca binária em 'numeros', ver _chave_numeros)
+COLUNAS_INDEXADAS = ('tribunal', 'categoria', 'nup_ano', 'nup_segmento', 'nup_origem')
+
+def _chave_numeros(df_final):
+    """
+    numeroProcesso do dataframe final (já ordenado) em um único array numpy de
+    bytes de largura fixa, para buscas binárias sem converter a coluna.
+    """
+    return df_final['numeroProcesso'].astype(str).str.encode('utf-8').to_numpy(dtype=object).astype(bytes)
+
+def _faixa_numero(numeros, chave, prefixo=False):
+    """
+    Faixa [inicio, fim) das posições de 'numeros' iguais à chave (bytes) ou,
+    com prefixo=True, que começam por ela.
+    """
+    if len(chave) > numeros.dtype.itemsize:
+        # Mais longa que todos os números: comparar exigiria converter o array inteiro
+        return 0, 0
+    inicio = int(numeros.searchsorted(chave, side='left'))
+    if prefixo and len(chave) < numeros.dtype.itemsize:
+        # 0xff nunca aparece em UTF-8: fica depois de qualquer continuação do prefixo
+        return inicio, int(numeros.searchsorted(chave + b'\xff', side='left'))
+    return inicio, int(numeros.searchsorted(chave, side='right'))
+
+def _build_indexes(df_final):
+    """
+    Cria índices {coluna: {valor: posições}} sobre o dataframe final.
+    As posições (arrays numpy ordenados) apontam para linhas de df_final.
+    """
     return {
-        'principal': df_principal,
-        'movements': df_movements,
-        'final': df_final
+        coluna: df_final.groupby(coluna, sort=False, observed=True).indices
+        for coluna in COLUNAS_INDEXADAS
     }
 
+def posicoes_filtradas(dataframes, **filtros):
+    """
+    Resolve filtros de igualdade pelos índices pré-calculados do cache.
+    
+    Args:
+        dataframes (dict): Resultado de get_auxiliary_dataframes()
+        **filtros: coluna=valor (ex: tribunal='TJRS'); None e '' são ignorados
+    
+    Returns:
+        numpy.ndarray | None: Posições ordenadas das linhas que atendem a todos
+            os filtros, ou None quando não há filtro (todas as linhas)
+    """
+    posicoes = None
+    for coluna, valor in filtros.items():
+        if valor is None or valor == '':
+            continue
+        if coluna == 'numeroProcesso':
+            encontradas = np.arange(*_faixa_numero(dataframes['numeros'], valor.encode('utf-8')), dtype=np.intp)
+        else:
+            encontradas = dataframes['indexes'][coluna].get(valor, np.empty(0, dtype=np.intp))
+        if posicoes is None:
+            posicoes = encontradas
+        else:
+            posicoes = np.intersect1d(posicoes, encontradas, assume_unique=True)
+    return posicoes
+
+def busca_prefixo(dataframes, prefixo, limite):
+    """
+    Busca numeroProcesso por prefixo no dataframe final, que já está ordenado
+    por número: duas buscas binárias delimitam as linhas com o prefixo.
+    O número exato vem primeiro; os demais, dos atualizados mais recentemente
+    para os mais antigos (sem data por último).
+    
+    Args:
+        dataframes (dict): Resultado de get_auxiliary_dataframes()
+        prefixo (str): Prefixo já normalizado (só dígitos)
+        limite (int): Máximo de posições retornadas
+    
+    Returns:
+        tuple: (posições ranqueadas, total de processos com o prefixo)
+    """
+    df = dataframes['final']
+    numeros = dataframes['numeros']
+    chave = prefixo.encode('utf-8')
+    inicio, fim = _faixa_numero(numeros, chave, prefixo=True)
+    total = fim - inicio
+    if total == 0:
+        return np.empty(0, dtype=np.intp), 0
+    
+    exato = int(numeros[inicio] == chave)
+    candidatas = np.arange(inicio + exato, fim)
+    # Ordem crescente de -data; NaT é o menor int64 e, negado, fica por último
+    datas = -df['dataHoraUltimaAtualizacao_dt'].to_numpy()[inicio + exato:fim].view('i8').astype(np.float64)
+    restantes = limite - exato
+    if 0 < restantes < len(candidatas):
+        melhores = np.argpartition(datas, restantes - 1)[:restantes]
+    else:
+        melhores = np.arange(len(candidatas) if restantes > 0 else 0)
+    melhores = melhores[np.lexsort((melhores, datas[melhores]))]
+    
+    posicoes = candidatas[melhores]
+    if exato:
+        posicoes = np.concatenate(([inicio], posicoes))
+    return posicoes, total
+
+def localiza_numeros(dataframes, numeros):
+    """
+    Localiza no dataframe final os números informados, na ordem recebida,
+    por busca binária em 'numeros' (o final está ordenado por numeroProcesso).
+    
+    Returns:
+        tuple: (posições dos números encontrados, máscara booleana de quais
+            dos números informados foram encontrados)
+    """
+    tabela = dataframes['numeros']
+    chaves = np.array([n.encode('utf-8') for n in numeros], dtype=bytes)
+    encontrados = np.zeros(len(chaves), dtype=bool)
+    if len(tabela) == 0 or len(chaves) == 0:
+        return np.empty(0, dtype=np.intp), encontrados
+    # Chaves mais longas que a largura do array não podem estar nele
+    cabem = np.char.str_len(chaves) <= tabela.dtype.itemsize
+    chaves_cabem = chaves[cabem].astype(tabela.dtype)
+    posicoes = np.minimum(tabela.searchsorted(chaves_cabem, side='left'), len(tabela) - 1).astype(np.intp)
+    achados = tabela[posicoes] == chaves_cabem
+    encontrados[np.flatnonzero(cabem)[achados]] = True
+    return posicoes[achados], encontrados
+
+def recorte(df, posicoes, inicio=0, fim=None):
+    """
+    Retorna as linhas [inicio:fim] de df restritas às posições filtradas
+    (ver posicoes_filtradas), sem copiar o dataframe inteiro.
+    """
+    if posicoes is None:
+        return df.iloc[inicio:fim]
+    return df.iloc[posicoes[inicio:fim]]
+
+def parse_datas(serie):
+    """
+    Converte uma série de datas em texto para datetime64 (sem timezone).
+    Aceita ISO 8601 (com 'Z' ou offset), 'YYYY-MM-DD HH:MM:SS', 'YYYY-MM-DD'
+    e 'DD/MM/YYYY HH:MM:SS'. O timezone é descartado sem conversão, como no
+    parsing linha a linha original. Valores inválidos viram NaT.
+    """
+    texto = serie.astype('string').str.strip()
+    
+    # Remover timezone apenas das datas no formato ISO (com 'T')
+    iso = texto.str.contains('T', regex=False, na=False)
+    texto = texto.mask(iso, texto.str.replace(r'(Z|[+-]\d{2}:?\d{2})$', '', regex=True))
+    
+    datas = pd.to_datetime(texto, format='ISO8601', errors='coerce')
+    
+    # Segunda tentativa para o formato brasileiro
+    faltantes = datas.isna() & texto.notna()
+    if faltantes.any():
+        datas[faltantes] = pd.to_datetime(texto[faltantes], format='%d/%m/%Y %H:%M:%S', errors='coerce')
+    
+    return datas
+
+def classifica_periodos(datas, agora=None):
+    """
+    Classifica cada data em um dos PERIODOS_ATUALIZACAO de forma vetorizada.
+    Datas ausentes ou inválidas caem em 'mais_de_um_ano'.
+    
+    Args:
+        datas (pandas.Series): Série datetime64 (ver parse_datas)
+        agora (datetime): Referência para o cálculo da idade (padrão: agora)
+    
+    Returns:
+        pandas.Series: Série categórica com o nome do período de cada linha
+    """
+    agora = agora or datetime.now()
+    idade_segundos = (pd.Timestamp(agora) - datas).dt.total_seconds()
+    
+    limites = [-np.inf] + [
+        dias * 86400 if dias is not None else np.inf
+        for _, dias in PERIODOS_ATUALIZACAO
+    ]
+    nomes = [nome for nome, _ in PERIODOS_ATUALIZACAO]
+    
+    periodos = pd.cut(idade_segundos, bins=limites, labels=nomes, right=True)
+    return periodos.fillna('mais_de_um_ano')
+
+def agrupa_por_periodo(df, colunas, agora=None):
+    """
+    Agrupa as linhas de um dataframe auxiliar por período de atualização.
+    
+    Args:
+        df (pandas.DataFrame): Recorte do dataframe 'final' (com dataHoraUltimaAtualizacao_dt)
+        colunas (dict): Mapeamento coluna do dataframe -> chave no JSON de saída
+        agora (datetime): Referência para o cálculo da idade (padrão: agora)
+    
+    Returns:
+        dict: {periodo: [registros]} com todos os PERIODOS_ATUALIZACAO presentes
+    """
+    periodos = classifica_periodos(df['dataHoraUltimaAtualizacao_dt'], agora)
+    
+    registros = np.empty(len(df), dtype=object)
+    registros[:] = dataframe_to_records(df, colunas)
+    
+    codigos = periodos.cat.codes.to_numpy()
+    return {
+        nome: registros[codigos == i].tolist()
+        for i, (nome, _) in enumerate(PERIODOS_ATUALIZACAO)
+    }
+
+def get_memory_report():
+    """
+    Retorna o uso de memória (bytes, deep) de cada coluna dos dataframes em cache.
+    
+    Returns:
+        dict: {dataframe: {'linhas', 'bytes', 'colunas': {coluna: {'dtype', 'bytes'}}}}
+            e o total geral em 'total_bytes'; vazio se o cache não foi criado
+    """
+    with _dataframe_cache['lock']:
+        dataframes = _dataframe_cache['data']
+        geracao = _dataframe_cache['geracao']
+    
+    relatorio = {'geracao': geracao, 'dataframes': {}, 'total_bytes': 0}
+    if dataframes is None:
+        return relatorio
+    
+    numeros = dataframes['numeros']
+    relatorio['arrays'] = {'numeros': {'dtype': str(numeros.dtype), 'bytes': int(numeros.nbytes)}}
+    relatorio['total_bytes'] += int(numeros.nbytes)
+    
+    for nome in ('final', 'excel'):
+        df = dataframes[nome]
+        uso = df.memory_usage(deep=True, index=True)
+        relatorio['dataframes'][nome] = {
+            'linhas': len(df),
+            'bytes': int(uso.sum()),
+            'colunas': {
+                coluna: {'dtype': str(df[coluna].dtype), 'bytes': int(uso[coluna])}
+                for coluna in df.columns
+            }
+        }
+        relatorio['total_bytes'] += int(uso.sum())
+    return relatorio
+
 def invalidate_dataframe_cache():
     """
-    Invalida o cache dos dataframes auxiliares.
-    Deve ser chamada sempre que o banco de dados for atualizado.
+    Invalida o cache dos dataframes auxiliares deste processo (a próxima
+    reconstrução é completa). Mudanças no banco já chegam a todos os workers
+    pela geração dos dados; para forçar a reconstrução em todos eles, use
+    database.incrementa_geracao.
     """
     global _cache_invalidated
     
@@ -219,7 +874,7 @@ def get_unique_categories(db_path='datajud_processos.db', excel_path='processos.
     """
     Retorna lista única de categorias sem duplicatas.
     IMPORTANTE: Retorna apenas categorias que existem no banco de dados atual.
-    SEM CACHE - sempre busca dados atuais.
+    Vem do índice de filtros do cache, recalculado a cada geração dos dados.
     
     Args:
         db_path (str): Caminho para o banco SQLite
@@ -229,84 +884,26 @@ def get_unique_categories(db_path='datajud_processos.db', excel_path='processos.
         list: Lista ordenada de categorias únicas que existem no banco
     """
     try:
-        from sqlalchemy import create_engine
-        
-        print(f"🔍 Buscando categorias em {db_path} e {excel_path}")
-        
-        # Conectar ao banco
-        engine = create_engine(f'sqlite:///{db_path}')
-        
-        # 1. Pegar todos os números de processo que existem no banco
-        df_banco = pd.read_sql("SELECT DISTINCT numeroProcesso FROM processos", engine)
-        print(f"📊 Processos no banco: {len(df_banco)}")
-        
-        # Converter para set para busca rápida
-        numeros_banco = set()
-        for _, row in df_banco.iterrows():
-            numero_limpo = normaliza_nup(row['numeroProcesso'])
-            numeros_banco.add(numero_limpo)
-        
-        # 2. Ler Excel e normalizar números
-        df_excel = pd.read_excel(excel_path)
-        print(f"📊 Processos no Excel: {len(df_excel)}")
-        
-        # 3. Pegar apenas categorias de processos que existem no banco
-        categorias = set()
-        for _, row in df_excel.iterrows():
-            numero_limpo = normaliza_nup(row['numeroProcesso'])
-            if numero_limpo in numeros_banco:
-                categoria = row.get('categoria')
-                if categoria and str(categoria).strip() != '':
-                    # Limpar e normalizar categoria
-                    categoria_limpa = str(categoria).strip()
-                    # Remover caracteres problemáticos se necessário
-                    categoria_limpa = categoria_limpa.replace('\xa0', ' ')  # Remove non-breaking spaces
-                    categorias.add(categoria_limpa)
-                    print(f"🔍 Adicionando categoria: '{categoria_limpa}'")
-        
-        # 4. Converter para lista ordenada
-        categorias = sorted(list(categorias))
-        
-        print(f"✅ Categorias encontradas: {categorias}")
-        return categorias
+        return list(get_auxiliary_dataframes(db_path, excel_path)['filtros']['categorias'])
     except Exception as e:
         print(f"❌ Erro ao obter categorias: {str(e)}")
-        import traceback
-        traceback.print_exc()
         return []
 
-def get_unique_tribunals(db_path='datajud_processos.db'):
+def get_unique_tribunals(db_path='datajud_processos.db', excel_path='processos.xlsx'):
     """
     Retorna lista única de tribunais sem duplicatas.
     IMPORTANTE: Retorna apenas tribunais que existem no banco de dados atual.
+    Vem do índice de filtros do cache, recalculado a cada geração dos dados.
     
     Args:
         db_path (str): Caminho para o banco SQLite
+        excel_path (str): Caminho para o arquivo Excel com categorias
     
     Returns:
         list: Lista ordenada de tribunais únicos que existem no banco
     """
     try:
-        from sqlalchemy import create_engine
-        
-        # Conectar ao banco
-        engine = create_engine(f'sqlite:///{db_path}')
-        
-        # Query para obter tribunais únicos
-        query = """
-            SELECT DISTINCT tribunal 
-            FROM processos 
-            WHERE tribunal IS NOT NULL 
-            ORDER BY tribunal
-        """
-        
-        df_tribunais = pd.read_sql(query, engine)
-        tribunais = df_tribunais['tribunal'].tolist()
-        
-        # Remover duplicatas e ordenar (caso ainda existam)
-        tribunais = sorted(list(set(tribunais)))
-        
-        return tribunais
+        return list(get_auxiliary_dataframes(db_path, excel_path)['filtros']['tribunais'])
     except Exception as e:
         print(f"❌ Erro ao obter tribunais: {str(e)}")
         return []
@@ -315,7 +912,8 @@ def update_filter_lists(db_path='datajud_processos.db', excel_path='processos.xl
     """
     Atualiza as listas de categorias e tribunais após atualização do banco.
     Garante que não há duplicatas nas listas.
-    SEM CACHE - sempre busca dados atuais.
+    Espera o cache chegar à geração atual dos dados (em vez de servir o
+    snapshot anterior enquanto ele é reconstruído).
     
     Args:
         db_path (str): Caminho para o banco SQLite
@@ -327,9 +925,9 @@ def update_filter_lists(db_path='datajud_processos.db', excel_path='processos.xl
     try:
         print("🔄 Atualizando listas de filtros (categorias e tribunais)...")
         
-        # Obter listas únicas (sem cache)
-        categorias = get_unique_categories(db_path, excel_path)
-        tribunais = get_unique_tribunals(db_path)
+        filtros = get_current_dataframes(db_path, excel_path)['filtros']
+        categorias = list(filtros['categorias'])
+        tribunais = list(filtros['tribunais'])
         
         print(f"✅ Categorias atualizadas: {len(categorias)} itens")
         print(f"✅ Tribunais atualizados: {len(tribunais)} itens")
@@ -345,6 +943,67 @@ def update_filter_lists(db_path='datajud_processos.db', excel_path='processos.xl
             'tribunais': []
         }
 
+# Dimensões de /stats: nome no parâmetro -> coluna do dataframe final
+# ('periodo' é calculado da data de atualização, ver classifica_periodos)
+DIMENSOES_STATS = {
+    'tribunal': 'tribunal',
+    'categoria': 'categoria',
+    'classe': 'classe_nome',
+    'municipio': 'orgaoJulgador_codigoMunicipioIBGE',
+    'periodo': None,
+}
+
+# Cubo de contagens com todas as DIMENSOES_STATS (e reagrupamentos já pedidos),
+# da geração e janela de tempo indicadas
+_stats_cache = {
+    'chave': None,
+    'cubo': None,
+    'agregados': {},
+    'lock': threading.Lock()
+}
+
+def contagens(dataframes, dimensoes, janela):
+    """
+    Contagens de processos agrupadas por um subconjunto das DIMENSOES_STATS.
+    O cubo com todas as dimensões é calculado uma vez por geração dos dados
+    e janela de tempo (os períodos dependem da hora atual); cada consulta
+    só reagrupa o cubo, que tem uma linha por combinação existente.
+    
+    Args:
+        dataframes (dict): Resultado de get_auxiliary_dataframes()
+        dimensoes (list): Nomes em DIMENSOES_STATS (vazio = só o total)
+        janela (int): Identificador da janela de tempo dos períodos
+    
+    Returns:
+        pandas.DataFrame: Colunas das dimensões + 'total', do maior para o menor
+    """
+    chave = (dataframes['geracao'], janela)
+    with _stats_cache['lock']:
+        if _stats_cache['chave'] != chave:
+            df_final = dataframes['final']
+            base = pd.DataFrame({
+                nome: df_final[coluna] if coluna else classifica_periodos(df_final['dataHoraUltimaAtualizacao_dt'])
+                for nome, coluna in DIMENSOES_STATS.items()
+            })
+            _stats_cache['cubo'] = (base.groupby(list(DIMENSOES_STATS), observed=True, dropna=False)
+                                    .size().rename('total').reset_index())
+            _stats_cache['agregados'] = {}
+            _stats_cache['chave'] = chave
+        cubo = _stats_cache['cubo']
+        agregado = _stats_cache['agregados'].get(tuple(dimensoes))
+    if agregado is not None:
+        return agregado
+    
+    if not dimensoes:
+        agregado = pd.DataFrame({'total': [int(cubo['total'].sum())]})
+    else:
+        agregado = (cubo.groupby(list(dimensoes), observed=True, dropna=False)['total'].sum().reset_index()
+                    .sort_values('total', ascending=False, kind='stable').reset_index(drop=True))
+    with _stats_cache['lock']:
+        if _stats_cache['chave'] == chave:
+            _stats_cache['agregados'][tuple(dimensoes)] = agregado
+    return agregado
+
 def get_processes_summary():
     """
     Retorna um resumo dos processos para exibição no UI.
@@ -391,10 +1050,7 @@ def get_processes_by_category(category=None):
         dataframes = get_auxiliary_dataframes()
         df_final = dataframes['final']
         
-        if category:
-            return df_final[df_final['categoria'] == category]
-        else:
-            return df_final
+        return recorte(df_final, posicoes_filtradas(dataframes, categoria=category))
     except Exception as e:
         return pd.DataFrame()
 
@@ -412,10 +1068,7 @@ def get_processes_by_tribunal(tribunal=None):
         dataframes = get_auxiliary_dataframes()
         df_final = dataframes['final']
         
-        if tribunal:
-            return df_final[df_final['tribunal'] == tribunal]
-        else:
-            return df_final
+        return recorte(df_final, posicoes_filtradas(dataframes, tribunal=tribunal))
     except Exception as e:
         return pd.DataFrame()
 
@@ -427,9 +1080,8 @@ if __name__ == "__main__":
         # Testar função principal
         dataframes = get_auxiliary_dataframes()
         print(f"✅ Dataframes criados:")
-        print(f"  - Principal: {len(dataframes['principal'])} linhas")
-        print(f"  - Movements: {len(dataframes['movements'])} linhas")
         print(f"  - Final: {len(dataframes['final'])} linhas")
+        print(f"  - Excel: {len(dataframes['excel'])} linhas")
         
         # Testar resumo
         summary = get_processes_summary()
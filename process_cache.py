@@ -0,0 +1,158 @@
+"""
+Cache em memória das respostas por processo (/processo, /movimentos, /processos/batch).
+
+Os mesmos processos são consultados muitas vezes entre atualizações do banco,
+então as respostas agregadas ficam em um cache LRU limitado por tamanho.
+A invalidação é direcionada: quando a geração dos dados muda, o registro
+de alterações do banco (ver dataframe_utils.changed_since) informa quais
+números foram alterados e apenas as entradas desses processos são
+descartadas. Só quando o registro não cobre o intervalo (ex: mudança geral)
+o cache inteiro é descartado.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from utils import get_data_generation, DB_PATH
+from dataframe_utils import changed_since
+
+# Cache global: chave (numero, *parametros) -> payload
+_process_cache = {
+    'data': OrderedDict(),
+    'keys_by_numero': {},
+    'geracao': None,
+    'max_size': int(os.getenv("PROCESS_CACHE_SIZE", 2048)),
+    'hits': 0,
+    'misses': 0,
+    'evictions': 0,
+    'invalidations': 0,
+    'lock': threading.Lock()
+}
+
+
+def get_cached(numero, *parametros):
+    """
+    Busca a resposta de um processo no cache.
+
+    Args:
+        numero (str): Número do processo
+        *parametros: Demais parâmetros que identificam a resposta (tipo, paginação...)
+
+    Returns:
+        O payload armazenado ou None (miss)
+    """
+    chave = (numero,) + parametros
+    geracao = get_data_generation()
+    with _process_cache['lock']:
+        _sync_generation(geracao)
+        payload = _process_cache['data'].get(chave)
+        if payload is None:
+            _process_cache['misses'] += 1
+            return None
+        _process_cache['data'].move_to_end(chave)
+        _process_cache['hits'] += 1
+        return payload
+
+
+def set_cached(numero, *parametros, payload):
+    """
+    Armazena a resposta de um processo, descartando as menos usadas se necessário.
+    O payload não deve ser alterado depois de armazenado.
+    """
+    chave = (numero,) + parametros
+    geracao = get_data_generation()
+    with _process_cache['lock']:
+        _sync_generation(geracao)
+        data = _process_cache['data']
+        data[chave] = payload
+        data.move_to_end(chave)
+        _process_cache['keys_by_numero'].setdefault(numero, set()).add(chave)
+
+        while len(data) > _process_cache['max_size']:
+            antiga, _ = data.popitem(last=False)
+            _remove_key_index(antiga)
+            _process_cache['evictions'] += 1
+
+
+def _sync_generation(geracao):
+    """
+    Se a geração dos dados mudou, descarta só as entradas dos processos
+    alterados desde a geração anterior; tudo, se o registro de alterações
+    não cobrir o intervalo (chamar com o lock adquirido).
+    """
+    anterior = _process_cache['geracao']
+    if anterior == geracao:
+        return
+    numeros = None
+    if anterior is not None and _process_cache['data']:
+        numeros = changed_since(DB_PATH, anterior, geracao)
+    if numeros is None:
+        _process_cache['invalidations'] += len(_process_cache['data'])
+        _process_cache['data'].clear()
+        _process_cache['keys_by_numero'].clear()
+    else:
+        _remove_numeros(numeros)
+    _process_cache['geracao'] = geracao
+
+
+def _remove_key_index(chave):
+    """
+    Remove a chave do índice por número (chamar com o lock adquirido).
+    """
+    chaves = _process_cache['keys_by_numero'].get(chave[0])
+    if chaves is not None:
+        chaves.discard(chave)
+        if not chaves:
+            del _process_cache['keys_by_numero'][chave[0]]
+
+
+def _remove_numeros(numeros):
+    """
+    Remove as entradas dos processos informados (chamar com o lock adquirido).
+
+    Returns:
+        int: Quantidade de entradas removidas
+    """
+    removidas = 0
+    for numero in numeros:
+        for chave in _process_cache['keys_by_numero'].pop(numero, ()):
+            _process_cache['data'].pop(chave, None)
+            removidas += 1
+    _process_cache['invalidations'] += removidas
+    return removidas
+
+
+def invalidate_processos(numeros=None):
+    """
+    Invalida as respostas em cache dos processos informados (as demais
+    entradas continuam válidas).
+
+    Args:
+        numeros (iterable): Números a descartar; None invalida tudo
+
+    Returns:
+        int: Quantidade de entradas removidas
+    """
+    with _process_cache['lock']:
+        if numeros is None:
+            numeros = list(_process_cache['keys_by_numero'])
+        return _remove_numeros(numeros)
+
+
+def get_process_cache_stats():
+    """
+    Retorna os contadores do cache por processo.
+    """
+    with _process_cache['lock']:
+        consultas = _process_cache['hits'] + _process_cache['misses']
+        return {
+            'geracao': _process_cache['geracao'],
+            'size': len(_process_cache['data']),
+            'max_size': _process_cache['max_size'],
+            'hits': _process_cache['hits'],
+            'misses': _process_cache['misses'],
+            'hit_rate': _process_cache['hits'] / consultas if consultas else 0.0,
+            'evictions': _process_cache['evictions'],
+            'invalidations': _process_cache['invalidations'],
+        }
@@ -1,6 +1,18 @@
 import os
+import io
+import csv
+import json
+import zlib
+import base64
+import hashlib
 import sqlite3
-from flask import Request
+import threading
+from flask import Request, Response
+
+try:
+    import orjson  # opcional: serialização JSON mais rápida
+except ImportError:
+    orjson = None
 
 # Caminho do banco (permite override por variável de ambiente)
 DB_PATH = os.getenv("DATAJUD_DB_PATH", "datajud_processos.db")
@@ -17,6 +29,49 @@ def get_conn() -> sqlite3.Connection:
     return conn
 
 
+# Conexões persistentes (uma por banco) usadas só para checar a geração dos dados
+_generation_state = {
+    'bancos': {},
+    'lock': threading.Lock()
+}
+
+
+def get_data_generation(db_path=None) -> int:
+    """
+    Retorna a geração atual dos dados (tabela meta), incrementada pelo
+    database.py em toda transação de escrita. Os caches da API usam esse
+    valor como chave em vez de datas de modificação de arquivos.
+
+    Usa PRAGMA data_version numa conexão persistente: o valor só muda quando
+    outra conexão grava no banco, então na maioria das chamadas a tabela meta
+    nem é lida.
+    """
+    db_path = db_path or DB_PATH
+    with _generation_state['lock']:
+        estado = _generation_state['bancos'].get(db_path)
+        if estado is None:
+            if not os.path.exists(db_path):
+                raise FileNotFoundError(f"Banco não encontrado em {db_path}")
+            estado = {
+                'conn': sqlite3.connect(db_path, check_same_thread=False),
+                'data_version': None,
+                'geracao': 0
+            }
+            _generation_state['bancos'][db_path] = estado
+
+        conn = estado['conn']
+        versao = conn.execute("PRAGMA data_version").fetchone()[0]
+        if versao != estado['data_version']:
+            try:
+                linha = conn.execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()
+                estado['geracao'] = linha[0] if linha else 0
+            except sqlite3.OperationalError:
+                # Banco anterior à tabela meta (ensure_schema ainda não rodou)
+                estado['geracao'] = 0
+            estado['data_version'] = versao
+        return estado['geracao']
+
+
 def rows_to_dicts(rows):
     """
     Converte lista de sqlite3.Row em lista de dict.
@@ -24,6 +79,143 @@ def rows_to_dicts(rows):
     return [dict(r) for r in rows]
 
 
+def cursor_to_records(cursor):
+    """
+    Converte o resultado de um cursor SQLite em lista de dict,
+    usando os nomes das colunas do próprio cursor (sem row_factory).
+    """
+    colunas = [c[0] for c in cursor.description]
+    return [dict(zip(colunas, linha)) for linha in cursor]
+
+
+def dataframe_to_records(df, colunas):
+    """
+    Converte um dataframe em lista de dict a partir dos arrays de cada coluna.
+    NaN/None viram None (null no JSON).
+
+    Args:
+        df (pandas.DataFrame): Dataframe (ou recorte) de origem
+        colunas (dict): Mapeamento coluna do dataframe -> chave no JSON de saída
+    """
+    valores = [
+        df[coluna].astype(object).where(df[coluna].notna(), None).tolist()
+        for coluna in colunas
+    ]
+    chaves = list(colunas.values())
+    return [dict(zip(chaves, linha)) for linha in zip(*valores)]
+
+
+def _json_default(obj):
+    """
+    Serializa tipos que o encoder JSON não conhece (numpy, pandas, datetime).
+    """
+    if hasattr(obj, "item"):
+        return obj.item()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Tipo não serializável em JSON: {type(obj).__name__}")
+
+
+def json_dumps(payload) -> bytes:
+    """
+    Codifica o payload em bytes JSON (UTF-8), com orjson quando disponível.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, default=_json_default,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def json_response(payload, status=200) -> Response:
+    """
+    Equivalente ao jsonify para listagens grandes: codifica direto em bytes.
+    """
+    return Response(json_dumps(payload), status=status, mimetype="application/json")
+
+
+def make_etag(request: Request, geracao, *partes) -> str:
+    """
+    ETag de uma resposta de leitura: geração dos dados servidos (ver
+    get_data_generation), caminho e query string, e partes extras que
+    também definam o conteúdo.
+    """
+    chave = json.dumps(
+        [request.path, sorted(request.args.items(multi=True)), *partes],
+        sort_keys=True, default=str
+    )
+    return f"g{geracao}-{hashlib.sha1(chave.encode()).hexdigest()[:16]}"
+
+
+def not_modified(request: Request, etag: str):
+    """
+    Retorna 304 se o If-None-Match do cliente contém o ETag, senão None.
+    """
+    if request.if_none_match.contains(etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    """
+    Marca a resposta com o ETag; no-cache faz o cliente revalidar a cada uso.
+    """
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def iter_export(cursor, formato, extras=None, comprimir=False, tamanho_bloco=64 * 1024, lote=1000):
+    """
+    Gera blocos de bytes (NDJSON ou CSV) a partir de um cursor SQLite,
+    lendo em lotes com fetchmany para manter a memória constante.
+
+    Args:
+        cursor: Cursor já executado
+        formato (str): 'ndjson' ou 'csv'
+        extras (dict): Colunas calculadas {nome: função(registro) -> valor}
+        comprimir (bool): Comprime a saída em gzip
+        tamanho_bloco (int): Tamanho aproximado de cada bloco emitido
+        lote (int): Linhas lidas do cursor por vez
+    """
+    extras = extras or {}
+    colunas = [c[0] for c in cursor.description]
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if comprimir else None
+
+    texto = io.StringIO()
+    escritor = csv.writer(texto) if formato == "csv" else None
+    buffer = bytearray()
+
+    if escritor:
+        escritor.writerow(colunas + list(extras))
+        buffer += texto.getvalue().encode("utf-8")
+
+    while True:
+        linhas = cursor.fetchmany(lote)
+        if not linhas:
+            break
+        for linha in linhas:
+            registro = dict(zip(colunas, linha))
+            for nome, funcao in extras.items():
+                registro[nome] = funcao(registro)
+            if escritor:
+                texto.seek(0)
+                texto.truncate()
+                escritor.writerow(registro.values())
+                buffer += texto.getvalue().encode("utf-8")
+            else:
+                buffer += json_dumps(registro)
+                buffer += b"\n"
+        if len(buffer) >= tamanho_bloco:
+            yield compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+            buffer.clear()
+
+    if compressor:
+        yield compressor.compress(bytes(buffer)) + compressor.flush()
+    elif buffer:
+        yield bytes(buffer)
+
+
 def get_pagination_params(request: Request):
     """
     Extrai limit/offset da query string com sanidade.
@@ -36,3 +228,107 @@ def get_pagination_params(request: Request):
     limit = max(1, min(limit, 1000))
     offset = max(0, offset)
     return limit, offset
+
+
+def encode_cursor(valores) -> str:
+    """
+    Gera um cursor opaco (base64 url-safe) a partir da chave de ordenação.
+    """
+    texto = json.dumps(valores, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(texto).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Decodifica um cursor gerado por encode_cursor.
+    Levanta ValueError se o cursor for inválido.
+    """
+    try:
+        texto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(texto)
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(valores, list) or len(valores) != 2 or not isinstance(valores[1], int):
+        raise ValueError("Cursor inválido")
+    return valores
+
+
+def get_cursor_params(request: Request):
+    """
+    Extrai cursor e a flag de total da query string.
+    O total é calculado por padrão apenas na primeira página (sem cursor);
+    use total=true/false para forçar.
+    """
+    cursor = request.args.get("cursor")
+    cursor = decode_cursor(cursor) if cursor else None
+    total = request.args.get("total")
+    if total is None:
+        incluir_total = cursor is None
+    else:
+        incluir_total = total.lower() in ("1", "true", "sim")
+    return cursor, incluir_total
+
+
+def keyset_page(conn, tabela, wheres, params, coluna_ordem, limit, cursor=None, offset=0, colunas="*"):
+    """
+    Paginação por chave (keyset) ordenando por coluna_ordem DESC, rowid DESC.
+    Cada página custa o mesmo que a primeira, pois parte do último registro
+    visto em vez de descartar linhas com OFFSET. Linhas com coluna_ordem nula
+    vêm por último (como no ORDER BY ... DESC do SQLite), numa segunda fase.
+
+    Args:
+        conn: Conexão SQLite
+        tabela (str): Tabela consultada
+        wheres (list): Condições SQL fixas (com placeholders ?)
+        params (list): Parâmetros das condições
+        coluna_ordem (str): Coluna de ordenação (idealmente indexada com os filtros)
+        limit (int): Tamanho da página
+        cursor (list): [valor, rowid] do último registro da página anterior
+        offset (int): Deslocamento legado, aplicado apenas sem cursor
+        colunas (str): Lista de colunas do SELECT (deve incluir coluna_ordem)
+
+    Returns:
+        tuple: (registros, next_cursor) — next_cursor é None na última página
+    """
+    select = f"SELECT {colunas}, rowid AS _rowid FROM {tabela}"
+    registros = []
+
+    fase_nula = cursor is not None and cursor[0] is None
+    if not fase_nula:
+        condicoes = wheres + [f"{coluna_ordem} IS NOT NULL"]
+        valores = list(params)
+        if cursor is not None:
+            condicoes.append(f"({coluna_ordem}, rowid) < (?, ?)")
+            valores += cursor
+            offset = 0
+        sql = (f"{select} WHERE {' AND '.join(condicoes)} "
+               f"ORDER BY {coluna_ordem} DESC, rowid DESC LIMIT ? OFFSET ?")
+        registros = cursor_to_records(conn.execute(sql, valores + [limit, offset]))
+
+    if len(registros) < limit:
+        condicoes = wheres + [f"{coluna_ordem} IS NULL"]
+        valores = list(params)
+        offset_nulos = 0
+        if fase_nula:
+            condicoes.append("rowid < ?")
+            valores.append(cursor[1])
+        elif cursor is None and offset and not registros:
+            # Offset legado avançou além das linhas com chave preenchida
+            nao_nulos = conn.execute(
+                f"SELECT COUNT(*) FROM {tabela} WHERE {' AND '.join(wheres + [f'{coluna_ordem} IS NOT NULL'])}",
+                params
+            ).fetchone()[0]
+            offset_nulos = max(0, offset - nao_nulos)
+        sql = (f"{select} WHERE {' AND '.join(condicoes)} "
+               f"ORDER BY rowid DESC LIMIT ? OFFSET ?")
+        registros += cursor_to_records(
+            conn.execute(sql, valores + [limit - len(registros), offset_nulos])
+        )
+
+    next_cursor = None
+    if len(registros) == limit:
+        ultimo = registros[-1]
+        next_cursor = encode_cursor([ultimo[coluna_ordem], ultimo["_rowid"]])
+    for registro in registros:
+        del registro["_rowid"]
+    return registros, next_cursor